@@ -0,0 +1,88 @@
+'''
+Benchmark suite for the extraction steps on synthetic sessions of growing size (synthetic_nwb.py).
+For each size one session is written to a temporary folder and every step is timed on it:
+1. extract   : open + phase windows + Saccade/Fixation/Blink arrays + trials (pipeline.load_session)
+2. overlap   : blink-artifact flagging of saccades and fixations (overlap.flag_artifacts)
+3. split     : merge, sort and Encoding/Recognition split (pipeline.phase_timeline)
+4. trials    : per recognition trial aggregation (pipeline.recognition_trial_table)
+Each step reports the best of --repeat wall times, events/sec and tracemalloc peak memory. Example:
+    python bench/bench_extraction.py --sizes 2000 8000 32000 --repeat 3
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic_nwb import write_session
+from eye_events import n_events
+from overlap import flag_artifacts
+from pipeline import load_session, phase_timeline, recognition_trial_table
+
+# Seconds of recording per fixation, so longer sessions keep a realistic event rate
+SECONDS_PER_FIXATION = 0.3
+
+
+def measure(func, repeat):
+    """(best wall time, peak traced bytes, last result) over repeat calls."""
+    best, peak, result = float('inf'), 0, None
+    for _ in range(repeat):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def bench_session(path, repeat):
+    """[(step, seconds, peak bytes, events processed)] for one synthetic session."""
+    t, peak, session = measure(lambda: load_session(path), repeat)
+    blinks, saccades, fixations = session['blinks'], session['saccades'], session['fixations']
+    n_moves = n_events(saccades) + n_events(fixations)
+    rows = [('extract', t, peak, n_moves + n_events(blinks))]
+
+    def flag():
+        sac, fix = dict(saccades), dict(fixations)
+        flag_artifacts(sac, blinks)
+        flag_artifacts(fix, blinks)
+    t, peak, _ = measure(flag, repeat)
+    rows.append(('overlap', t, peak, n_moves))
+
+    t, peak, _ = measure(lambda: phase_timeline(saccades, fixations, session['enco_window'],
+                                                session['reco_window']), repeat)
+    rows.append(('split', t, peak, n_moves))
+
+    t, peak, _ = measure(lambda: recognition_trial_table(session['trials'], fixations, saccades), repeat)
+    rows.append(('trials', t, peak, n_moves))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the extraction steps on synthetic sessions.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2000, 8000, 32000],
+                        help='fixations (and saccades) per session')
+    parser.add_argument('--reco-trials', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--keep', default=None, help='write the sessions here and keep them')
+    args = parser.parse_args()
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix='bench_nwb_')
+    print(f"{'Fixations':>9} | {'Step':<8} | {'Time':>9} | {'Events/s':>12} | {'Peak MB':>8}")
+    print("-" * 58)
+    try:
+        for size in args.sizes:
+            path = os.path.join(work_dir, f"bench_{size}_behavior+ecephys.nwb")
+            if not os.path.exists(path):
+                write_session(path, seed=size, duration_s=size * SECONDS_PER_FIXATION, n_fix=size,
+                              n_reco=args.reco_trials, gaze_rate=0)
+            for step, t, peak, n in bench_session(path, args.repeat):
+                print(f"{size:>9} | {step:<8} | {t:>8.4f}s | {n / max(t, 1e-9):>12,.0f} | {peak / 2**20:>8.2f}")
+            print("-" * 58)
+    finally:
+        if args.keep is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,81 @@
+'''
+Memory benchmark: the full extracted dataset as legacy list-of-dicts (the old pickles) vs columnar
+event sets vs packed EVENT_DTYPE records. In-memory sizes are measured with tracemalloc while each
+form is built; serialized sizes are the pickle, the partitioned store and the records .npz. Example:
+    python bench/bench_memory.py --path pkl/flagged_eye_events
+--path takes an event store, a records .npz or a legacy .pkl (run capture_all.py first).
+'''
+import os
+import sys
+import pickle
+import shutil
+import tempfile
+import tracemalloc
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from eye_events import EVENT_COLUMNS, to_records
+from event_store import load_any, to_legacy, write_store, save_records
+
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def traced_build(func):
+    """(result, bytes still allocated by func's result)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = func()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def partitions(nested):
+    return [events for runs in nested.values() for phases in runs.values() for events in phases.values()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare event representations by memory and file size.')
+    parser.add_argument('--path', default=os.path.join(current_dir, 'pkl', 'flagged_eye_events'))
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        print(f"{args.path} not found (run capture_all.py first).")
+        sys.exit(1)
+
+    source = load_any(args.path)
+    # Plain in-memory copies (no memory maps), so every form is measured the same way
+    columnar, columnar_bytes = traced_build(lambda: {p: {r: {ph: {c: a.copy() for c, a in ev.items()}
+                                                             for ph, ev in phases.items()}
+                                                         for r, phases in runs.items()}
+                                                     for p, runs in source.items()})
+    n = sum(len(ev['start']) for ev in partitions(columnar))
+    legacy, legacy_bytes = traced_build(lambda: to_legacy(columnar))
+    records, records_bytes = traced_build(lambda: [to_records(ev) for ev in partitions(columnar)])
+
+    work_dir = tempfile.mkdtemp(prefix='bench_mem_')
+    try:
+        pkl_file = os.path.join(work_dir, 'events.pkl')
+        with open(pkl_file, 'wb') as f:
+            pickle.dump(legacy, f)
+        store_dir = os.path.join(work_dir, 'store')
+        parts = partitions(columnar)
+        write_store(store_dir, columnar, [c for c in EVENT_COLUMNS if not parts or c in parts[0]])
+        npz_file = os.path.join(work_dir, 'events.npz')
+        save_records(npz_file, columnar)
+        sizes = {'pickle': os.path.getsize(pkl_file), 'store': dir_size(store_dir), 'npz': os.path.getsize(npz_file)}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Events: {n:,} in {len(partitions(columnar))} partitions ({args.path})\n")
+    print(f"{'Representation':<26} | {'Total MB':>9} | {'Bytes/event':>11}")
+    print("-" * 53)
+    rows = [('list of dicts (in memory)', legacy_bytes), ('columnar (in memory)', columnar_bytes),
+            ('EVENT_DTYPE records', records_bytes), ('legacy pickle (file)', sizes['pickle']),
+            ('event store (files)', sizes['store']), ('records .npz (file)', sizes['npz'])]
+    for name, size in rows:
+        print(f"{name:<26} | {size / 2**20:>9.2f} | {size / max(n, 1):>11.1f}")
+    print(f"\nlist of dicts / records: {legacy_bytes / max(records_bytes, 1):.1f}x")
@@ -0,0 +1,61 @@
+'''
+Benchmark: time to open a session and reach the behavior arrays, pynwb io.read() vs the h5py
+fast path in nwb_session.py. For every .nwb file under --data it times
+1. open  : NWBHDF5IO(...).read() vs open_nwb() (object-graph construction only)
+2. total : open + phase windows + Saccade/Fixation/Blink event arrays (what the extractors do)
+Each measurement is the best of --repeat runs. Example:
+    python bench/bench_open.py --data "nwb files" --repeat 3
+'''
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from nwb_session import open_nwb
+from sessions import find_sessions
+from eye_events import get_event_arrays, get_encoding_recognition_windows
+
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_open(path, fast):
+    t0 = time.perf_counter()
+    with open_nwb(path, fast=fast) as nwb:
+        t_open = time.perf_counter() - t0
+        beh = nwb.processing['behavior']
+        get_encoding_recognition_windows(nwb)
+        for name in ('Saccade', 'Fixation', 'Blink'):
+            get_event_arrays(beh, name)
+    return t_open, time.perf_counter() - t0
+
+
+def best_of(path, fast, repeat):
+    runs = [time_open(path, fast) for _ in range(repeat)]
+    return min(r[0] for r in runs), min(r[1] for r in runs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare pynwb io.read() with the h5py fast path.')
+    parser.add_argument('--data', default=os.path.join(current_dir, 'nwb files'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    paths = find_sessions(args.data)
+    if not paths:
+        print(f"No .nwb files under {args.data} (synthetic_nwb.py can generate some).")
+        sys.exit(1)
+
+    print(f"{'Session':<32} | {'pynwb open':>10} | {'fast open':>10} | {'pynwb total':>11} | {'fast total':>10}")
+    print("-" * 86)
+    sums = [0.0, 0.0, 0.0, 0.0]
+    for path in paths:
+        slow_open, slow_total = best_of(path, False, args.repeat)
+        fast_open, fast_total = best_of(path, True, args.repeat)
+        for i, v in enumerate((slow_open, fast_open, slow_total, fast_total)):
+            sums[i] += v
+        name = os.path.basename(path).split('_behavior')[0]
+        print(f"{name:<32} | {slow_open:>9.3f}s | {fast_open:>9.3f}s | {slow_total:>10.3f}s | {fast_total:>9.3f}s")
+    print("-" * 86)
+    print(f"{'Total':<32} | {sums[0]:>9.3f}s | {sums[1]:>9.3f}s | {sums[2]:>10.3f}s | {sums[3]:>9.3f}s")
+    print(f"Startup speed-up: {sums[0] / max(sums[1], 1e-9):.1f}x, end-to-end: {sums[2] / max(sums[3], 1e-9):.1f}x")
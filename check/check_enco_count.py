@@ -1,19 +1,20 @@
 """
 Shows one patient's trials in time order and confirms: 1 encoding block, then recognition.
 """
-from pynwb import NWBHDF5IO
-import pandas as pd
 import os
+import sys
 
-# Path from project root (works when run from check/ folder)
-base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-f_path = os.path.join(base, 'nwb files', 'sub-CS48', 'sub-CS48_ses-P48CSR1_behavior+ecephys.nwb')
+# Project root on the path (works when run from check/ folder)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from nwb_session import open_nwb
+
+f_path = config.session_path('sub-CS48', 'R1')
 
 if not os.path.exists(f_path):
     print("File not found:", f_path)
 else:
-    with NWBHDF5IO(f_path, 'r') as io:
-        nwb = io.read()
+    with open_nwb(f_path) as nwb:
         trials_df = nwb.intervals['trials'].to_dataframe()
     trials_df = trials_df.sort_values('start_time').reset_index(drop=True)
 
@@ -0,0 +1,24 @@
+"""
+Checks the per-stage memory peaks of profiling.py with nested stages: an allocation made in a stage
+before a nested stage starts must still count towards that stage's peak_mb (and the session peak).
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import profiling
+
+with profiling.SessionProfile('nested') as profile:
+    with profiling.stage('outer'):
+        big = np.ones(50 * 2**20, dtype=np.uint8)
+        del big
+        with profiling.stage('inner'):
+            small = np.ones(2**20, dtype=np.uint8)
+            del small
+
+outer, inner = profile.stages['outer']['peak_mb'], profile.stages['inner']['peak_mb']
+print(f"outer peak {outer:.1f} MB, inner peak {inner:.1f} MB, session peak {profile.peak_mb:.1f} MB")
+ok = outer >= 50 and 1 <= inner < 2 and profile.peak_mb >= 50
+print("OK" if ok else "FAIL: an enclosing stage lost the peak it reached before a nested stage")
+sys.exit(0 if ok else 1)
@@ -3,17 +3,19 @@ Simple view of the trials table: see start_time, stop_time, stim_phase. It shows
  There is only 1 encoding row because it was continuous 1 task. there are 40 recognition rows because they had 40 frames for yes or no answers.
 This table shows there are no rows during the gap (time between encoding end and recognition start) but there is a gap.
 """
-from pynwb import NWBHDF5IO
-import pandas as pd
 import os
+import sys
 
-f_path = r'e:\eyetracking\nwb files\sub-CS43\sub-CS43_ses-P43CSR2_behavior+ecephys.nwb'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from nwb_session import open_nwb
+
+f_path = config.session_path('sub-CS43', 'R2')
 
 if not os.path.exists(f_path):
     print("File not found:", f_path)
 else:
-    with NWBHDF5IO(f_path, 'r') as io:
-        nwb = io.read()
+    with open_nwb(f_path) as nwb:
         trials_df = nwb.intervals['trials'].to_dataframe()
 
     trials_df = trials_df.sort_values('start_time').reset_index(drop=True)
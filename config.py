@@ -0,0 +1,24 @@
+'''
+Shared paths for the scripts and the nwb_eyetracking.py command line.
+Defaults are the folders next to this file: 'nwb files' (sub-CS*/ .nwb files), 'pkl' (extracted
+events, caches, reports) and 'plots'. Each can be overridden with an environment variable, e.g.
+    set NWB_EYETRACKING_DATA=e:\\eyetracking\\nwb files
+or with --data / --pkl / --plots on nwb_eyetracking.py (which sets the same variables).
+'''
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+DATA_ENV = 'NWB_EYETRACKING_DATA'
+PKL_ENV = 'NWB_EYETRACKING_PKL'
+PLOTS_ENV = 'NWB_EYETRACKING_PLOTS'
+
+data_path = os.environ.get(DATA_ENV) or os.path.join(current_dir, 'nwb files')
+pkl_folder = os.environ.get(PKL_ENV) or os.path.join(current_dir, 'pkl')
+plot_folder = os.environ.get(PLOTS_ENV) or os.path.join(current_dir, 'plots')
+
+
+def session_path(pid, run_key='R1'):
+    """Path of one session file, e.g. ('sub-CS41', 'R1') -> <data>/sub-CS41/sub-CS41_ses-P41CSR1_behavior+ecephys.nwb"""
+    num = pid.split('CS')[-1]
+    return os.path.join(data_path, pid, f"{pid}_ses-P{num}CS{run_key}_behavior+ecephys.nwb")
@@ -0,0 +1,338 @@
+'''
+Saccade/fixation/blink detection from the raw EyeTracking SpatialSeries, so events can be re-detected
+with other thresholds and compared with the vendor tables stored in the NWB files.
+Every sample gets a label, then runs of equal labels become events:
+-> 'ivt' (velocity threshold): saccade where sample velocity > velocity_threshold, else fixation
+-> 'idt' (dispersion threshold): fixation where the sample lies in a window of min_fixation seconds whose
+   dispersion (x range + y range) is <= dispersion_threshold, else saccade
+-> samples with missing X/Y are blinks when the gap lasts min_blink..max_blink seconds (longer gaps are track loss)
+Velocities and dispersions are NumPy array operations, labels are run-length encoded, and the stream is
+read in chunks (gaze_stream.iter_gaze_chunks): each chunk only commits the samples whose neighbours
+(context) are known, keeps the tail as context for the next chunk, and a run still open at the chunk end
+is stitched to the first run of the next one, so the result does not depend on chunk_rows.
+Units: thresholds are in deg and deg/s. Positions are divided by px_per_deg, which is required (--px-per-deg)
+unless the series unit is already an angle (see resolve_px_per_deg); pixel gaze is never thresholded as deg.
+Events use the columnar schema of eye_events (the same as sac_fix.get_event_timeline): event start = first
+sample, end = first sample of the next run; saccade amplitude = start-to-end distance, velocity = peak
+velocity; fixation pupil_size = mean pupil (if the series has a pupil column).
+Run directly to write pkl/detected_eye_events/ (phase split, like sac_fix) and pkl/detection_report.csv
+(recall/precision and onset differences against the stored events).
+'''
+import os
+import csv
+import argparse
+import numpy as np
+import config
+from nwb_session import open_nwb
+from eye_events import (empty_events, get_event_arrays, get_encoding_recognition_windows, concat_events,
+                        sort_by_start, split_by_phase, n_events, EVENT_COLUMNS)
+from gaze_stream import gaze_series, iter_gaze_chunks, DEFAULT_CHUNK_ROWS
+from overlap import overlap_index
+from sessions import find_sessions, session_key, run_sessions, add_jobs_argument
+
+data_path = config.data_path
+output_folder = config.pkl_folder
+
+METHODS = ('ivt', 'idt')
+FIXATION, SACCADE, MISSING = 0, 1, 2
+LABEL_TYPES = {FIXATION: 'Fixation', SACCADE: 'Saccade', MISSING: 'Blink'}
+
+DEFAULTS = {
+    'velocity_threshold': 30.0,    # deg/s (ivt)
+    'dispersion_threshold': 1.0,   # deg (idt)
+    'min_fixation': 0.06,          # s (also the idt window length)
+    'min_saccade': 0.006,          # s
+    'min_blink': 0.03,             # s
+    'max_blink': 1.0,              # s
+    'px_per_deg': None,            # px per deg; None: the series must be in deg
+}
+ANGLE_UNITS = ('deg', 'degree', 'degrees')
+# Samples used to estimate the sample period of a series without a rate (same for any chunk size)
+PERIOD_PROBE = 1024
+SEGMENT_FIELDS = ('label', 't0', 't_next', 'n', 'sum_pupil', 'n_pupil', 'vmax', 'x0', 'y0', 'x1', 'y1')
+
+
+def resolve_px_per_deg(series, px_per_deg=None):
+    """px_per_deg to use for a series: the given value, or 1.0 if the series unit is an angle."""
+    if px_per_deg is not None:
+        if px_per_deg <= 0:
+            raise ValueError(f"px_per_deg must be > 0, got {px_per_deg}")
+        return float(px_per_deg)
+    unit = getattr(series, 'unit', None)
+    if isinstance(unit, bytes):
+        unit = unit.decode()
+    if unit is not None and str(unit).strip().lower() in ANGLE_UNITS:
+        return 1.0
+    raise ValueError(f"gaze unit is {unit!r}, not degrees: pass px_per_deg (--px-per-deg) so the "
+                     f"deg and deg/s thresholds apply")
+
+
+def _data_unit_params(params):
+    """DEFAULTS updated with params; px_per_deg None (not resolved against a series) means data units."""
+    params = dict(DEFAULTS, **(params or {}))
+    if params['px_per_deg'] is None:
+        params['px_per_deg'] = 1.0
+    return params
+
+
+def sample_velocity(t, x, y, px_per_deg=1.0):
+    """Velocity of each sample from the previous one (NaN for the first sample and around gaps)."""
+    v = np.full(len(t), np.nan)
+    if len(t) > 1:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            v[1:] = np.hypot(np.diff(x), np.diff(y)) / np.diff(t) / px_per_deg
+    return v
+
+
+def ivt_labels(x, y, v, params):
+    labels = np.where(v > params['velocity_threshold'], SACCADE, FIXATION).astype(np.int8)
+    labels[np.isnan(x) | np.isnan(y)] = MISSING
+    return labels
+
+
+def idt_labels(x, y, window, params):
+    """Sliding-window I-DT: a sample is fixation if any window of `window` samples containing it
+    has dispersion <= dispersion_threshold (windows with missing samples never qualify)."""
+    from scipy.ndimage import maximum_filter1d, minimum_filter1d
+    n = len(x)
+    missing = np.isnan(x) | np.isnan(y)
+    labels = np.full(n, SACCADE, dtype=np.int8)
+    if n >= window:
+        disp = np.zeros(n)
+        for a in (x, y):
+            # +-inf at missing samples makes every window touching them infinitely dispersed
+            disp += maximum_filter1d(np.where(missing, np.inf, a), window, mode='nearest')
+            disp -= minimum_filter1d(np.where(missing, -np.inf, a), window, mode='nearest')
+        # centred filter output j covers the window starting at j - window // 2
+        ok = disp[window // 2: window // 2 + n - window + 1] / params['px_per_deg'] <= params['dispersion_threshold']
+        cs = np.concatenate([[0], np.cumsum(ok)])
+        k = np.arange(n)
+        first = np.clip(k - window + 1, 0, n - window + 1)
+        last = np.clip(k + 1, 0, n - window + 1)
+        labels[cs[last] - cs[first] > 0] = FIXATION
+    labels[missing] = MISSING
+    return labels
+
+
+def runs(labels):
+    """(starts, stops, values) of runs of equal labels: labels[starts[i]:stops[i]] == values[i]."""
+    if len(labels) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, labels[:0]
+    change = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+    starts = np.concatenate([[0], change])
+    stops = np.concatenate([change, [len(labels)]])
+    return starts, stops, labels[starts]
+
+
+def _segments(buf, v, labels, lo, hi):
+    """Per-run aggregates of the samples buf[lo:hi] (t_next is NaN for the last run)."""
+    t = buf['t'][lo:hi]
+    starts, stops, values = runs(labels[lo:hi])
+    pupil = buf['pupil'][lo:hi] if 'pupil' in buf else np.full(len(t), np.nan)
+    has_pupil = ~np.isnan(pupil)
+    seg = {'label': values, 't0': t[starts], 't_next': np.append(t[stops[:-1]], np.nan),
+           'n': stops - starts,
+           'sum_pupil': np.add.reduceat(np.where(has_pupil, pupil, 0.0), starts) if len(t) else np.empty(0),
+           'n_pupil': np.add.reduceat(has_pupil.astype(np.int64), starts) if len(t) else np.empty(0, dtype=np.int64),
+           'vmax': np.fmax.reduceat(v[lo:hi], starts) if len(t) else np.empty(0)}
+    for name, arr, idx in (('x0', buf['x'], starts), ('y0', buf['y'], starts),
+                           ('x1', buf['x'], stops - 1), ('y1', buf['y'], stops - 1)):
+        seg[name] = arr[lo:hi][idx]
+    return seg
+
+
+def _stitch(open_seg, seg):
+    """Join the run left open by the previous chunk to this chunk's runs; returns (closed, new open)."""
+    if len(seg['label']) == 0:
+        return None, open_seg
+    if open_seg is not None:
+        if open_seg['label'][0] == seg['label'][0]:
+            seg = {k: v.copy() for k, v in seg.items()}
+            for k in ('t0', 'x0', 'y0'):
+                seg[k][0] = open_seg[k][0]
+            for k in ('n', 'sum_pupil', 'n_pupil'):
+                seg[k][0] += open_seg[k][0]
+            seg['vmax'][0] = np.fmax(seg['vmax'][0], open_seg['vmax'][0])
+        else:
+            open_seg = dict(open_seg, t_next=seg['t0'][:1].copy())
+            seg = {k: np.concatenate([open_seg[k], seg[k]]) for k in SEGMENT_FIELDS}
+    closed = {k: v[:-1] for k, v in seg.items()}
+    return closed, {k: v[-1:] for k, v in seg.items()}
+
+
+def label_stream(chunks, method='ivt', params=None, rate=None):
+    """Segments (dict of arrays, SEGMENT_FIELDS) for the labelled sample runs of a chunk stream."""
+    params = _data_unit_params(params)
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    window = None
+    closed, open_seg, carry, a = [], None, None, 0
+
+    def labels_for(buf):
+        v = sample_velocity(buf['t'], buf['x'], buf['y'], params['px_per_deg'])
+        if method == 'ivt':
+            return v, ivt_labels(buf['x'], buf['y'], v, params)
+        return v, idt_labels(buf['x'], buf['y'], window, params)
+
+    def window_for(t):
+        # Without a rate the period comes from the first PERIOD_PROBE samples, whatever the chunk size
+        dt = 1.0 / rate if rate else np.median(np.diff(t[:PERIOD_PROBE]))
+        return max(2, int(round(params['min_fixation'] / dt)))
+
+    for chunk in chunks:
+        buf = chunk if carry is None else {k: np.concatenate([carry[k], chunk[k]]) for k in chunk}
+        if window is None:
+            if not rate and len(buf['t']) < PERIOD_PROBE:
+                carry = buf
+                continue
+            window = window_for(buf['t'])
+        # samples needed on each side of a sample before its label is final
+        context = 1 if method == 'ivt' else window - 1
+        stop = len(buf['t']) - context
+        if stop <= a:
+            carry = buf
+            continue
+        v, labels = labels_for(buf)
+        done, open_seg = _stitch(open_seg, _segments(buf, v, labels, a, stop))
+        if done is not None:
+            closed.append(done)
+        keep = max(0, stop - context)
+        carry = {k: arr[keep:] for k, arr in buf.items()}
+        a = stop - keep
+
+    if carry is not None and a < len(carry['t']):
+        if window is None:
+            # stream shorter than PERIOD_PROBE samples (one sample: any window labels it alike)
+            window = window_for(carry['t']) if len(carry['t']) > 1 else 2
+        v, labels = labels_for(carry)
+        done, open_seg = _stitch(open_seg, _segments(carry, v, labels, a, len(carry['t'])))
+        if done is not None:
+            closed.append(done)
+    if open_seg is not None:
+        # last run ends one sample period after its last sample
+        last_t = carry['t'][-1]
+        period = np.median(np.diff(carry['t'])) if len(carry['t']) > 1 else 0.0
+        closed.append(dict(open_seg, t_next=np.array([last_t + period])))
+    if not closed:
+        return {k: np.empty(0) for k in SEGMENT_FIELDS}
+    return {k: np.concatenate([c[k] for c in closed]) for k in SEGMENT_FIELDS}
+
+
+def segments_to_events(seg, params=None):
+    """{'Saccade', 'Fixation', 'Blink'}: columnar event sets from the segments, after the duration limits."""
+    params = _data_unit_params(params)
+    duration = seg['t_next'] - seg['t0']
+    limits = {FIXATION: (params['min_fixation'], np.inf), SACCADE: (params['min_saccade'], np.inf),
+              MISSING: (params['min_blink'], params['max_blink'])}
+    out = {}
+    for label, name in LABEL_TYPES.items():
+        lo, hi = limits[label]
+        keep = (seg['label'] == label) & (duration >= lo) & (duration <= hi)
+        events = empty_events(int(keep.sum()), name)
+        events['start'] = seg['t0'][keep]
+        events['end'] = seg['t_next'][keep]
+        events['duration'] = duration[keep]
+        if name == 'Saccade':
+            events['amplitude'] = np.hypot(seg['x1'][keep] - seg['x0'][keep],
+                                           seg['y1'][keep] - seg['y0'][keep]) / params['px_per_deg']
+            events['velocity'] = seg['vmax'][keep]
+        elif name == 'Fixation':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                events['pupil_size'] = np.where(seg['n_pupil'][keep] > 0,
+                                                seg['sum_pupil'][keep] / seg['n_pupil'][keep], np.nan)
+        out[name] = events
+    return out
+
+
+def detect_events(series, method='ivt', params=None, chunk_rows=DEFAULT_CHUNK_ROWS, t_window=None):
+    """Detected {'Saccade', 'Fixation', 'Blink'} event sets for a SpatialSeries (streamed in chunks)."""
+    params = dict(DEFAULTS, **(params or {}))
+    params['px_per_deg'] = resolve_px_per_deg(series, params['px_per_deg'])
+    rate = series.rate if series.timestamps is None else None
+    seg = label_stream(iter_gaze_chunks(series, chunk_rows, t_window), method, params, rate)
+    return segments_to_events(seg, params)
+
+
+def compare_events(detected, stored):
+    """Per event type: counts, recall (stored events overlapped by a detected one), precision (detected
+    events overlapping a stored one), median |onset difference| and mean durations of both sets."""
+    rows = []
+    for name in LABEL_TYPES.values():
+        d, s = detected[name], stored[name]
+        s_hit = overlap_index(s['start'], s['end'], d['start'], d['end'])
+        d_hit = overlap_index(d['start'], d['end'], s['start'], s['end'])
+        matched = s_hit >= 0
+        onset = np.abs(d['start'][s_hit[matched]] - s['start'][matched])
+        rows.append({
+            'type': name,
+            'n_stored': n_events(s),
+            'n_detected': n_events(d),
+            'recall': float(matched.mean()) if n_events(s) else np.nan,
+            'precision': float((d_hit >= 0).mean()) if n_events(d) else np.nan,
+            'median_onset_diff': float(np.median(onset)) if len(onset) else np.nan,
+            'stored_mean_dur': float(s['duration'].mean()) if n_events(s) else np.nan,
+            'detected_mean_dur': float(d['duration'].mean()) if n_events(d) else np.nan,
+        })
+    return rows
+
+
+def detect_session(full_path, method='ivt', params=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """(encoding_events, recognition_events, report rows) for one session: detected saccades + fixations
+    split by phase like sac_fix, and the comparison with the stored events over the same span."""
+    with open_nwb(full_path) as nwb:
+        beh = nwb.processing['behavior']
+        if 'EyeTracking' not in beh.data_interfaces:
+            raise ValueError('no EyeTracking SpatialSeries')
+        enco_window, reco_window = get_encoding_recognition_windows(nwb, full_path)
+        detected = detect_events(gaze_series(nwb), method, params, chunk_rows)
+        stored = {name: get_event_arrays(beh, name) for name in LABEL_TYPES.values()}
+
+    timeline = sort_by_start(concat_events(detected['Saccade'], detected['Fixation']))
+    enc, rec = split_by_phase(timeline, enco_window, reco_window)
+    return enc, rec, compare_events(detected, stored)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Detect events from raw gaze and compare with the stored ones.')
+    add_jobs_argument(parser)
+    parser.add_argument('--method', choices=METHODS, default='ivt')
+    for key, value in DEFAULTS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=float, default=value,
+                            help='required unless the gaze unit is degrees' if key == 'px_per_deg' else None)
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='samples per read')
+    args = parser.parse_args()
+    params = {key: getattr(args, key) for key in DEFAULTS}
+
+    from event_store import write_store
+    nested = {}
+    report = []
+    print(f"Detecting events ({args.method}) from raw gaze in {data_path}...\n")
+    for full_path, result, error in run_sessions(detect_session, find_sessions(data_path), args.jobs,
+                                                 (args.method, params, args.chunk_rows)):
+        pid, run_key = session_key(full_path)
+        if error is not None:
+            print(f"Error in {os.path.basename(full_path)}: {error}")
+            continue
+        enc, rec, rows = result
+        nested.setdefault(pid, {})[run_key] = {'Encoding': enc, 'Recognition': rec}
+        for row in rows:
+            report.append(dict(row, pid=pid, run=run_key))
+        summary = ', '.join(f"{r['type']} {r['n_detected']}/{r['n_stored']} "
+                            f"(recall {r['recall']:.2f}, precision {r['precision']:.2f})" for r in rows)
+        print(f"{pid} ({run_key}): detected/stored {summary}")
+
+    if not nested:
+        raise SystemExit("\nNo session was detected; nothing written.")
+    os.makedirs(output_folder, exist_ok=True)
+    store_path = os.path.join(output_folder, 'detected_eye_events')
+    write_store(store_path, nested, [col for col in EVENT_COLUMNS if col != 'is_artifact'])
+    report_path = os.path.join(output_folder, 'detection_report.csv')
+    fields = ['pid', 'run', 'type', 'n_stored', 'n_detected', 'recall', 'precision', 'median_onset_diff',
+              'stored_mean_dur', 'detected_mean_dur']
+    with open(report_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(report)
+    print(f"\nDetected events saved to: {store_path}")
+    print(f"Comparison report saved to: {report_path}")
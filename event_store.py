@@ -0,0 +1,294 @@
+'''
+Partitioned columnar store for the extracted eye events (replaces the monolithic pickles).
+Layout: <store>/<pid>/<R1|R2>/<Encoding|Recognition>/<column>.npy, one file per column of the
+columnar event sets from eye_events.py, plus <store>/_store.json listing the columns written.
+Loading reads only the partitions (and columns) asked for, memory-mapped, so reading one
+patient/run/phase no longer unpickles the whole dataset.
+Pickle import/export keeps the old [pid][run][phase] = list of event dicts format:
+    python event_store.py to-pickle pkl/flagged_eye_events pkl/flagged_eye_events.pkl
+    python event_store.py from-pickle pkl/flagged_eye_events.pkl pkl/flagged_eye_events
+A single-file export packs every partition as an EVENT_DTYPE record array in one .npz:
+    python event_store.py to-records pkl/flagged_eye_events pkl/flagged_eye_events.npz
+load_any() reads any of the three (store directory, .npz, legacy .pkl) into nested event sets.
+EventStore(path).query(pid=..., run=..., phase=..., type='Fixation', artifact=False, t_range=(a, b))
+selects partitions from the directory names and reads only the filter columns before the output
+columns, so an ad-hoc slice never loads the rest of the store.
+'''
+import os
+import sys
+import json
+import shutil
+import pickle
+import numpy as np
+from eye_events import (EVENT_COLUMNS, TYPE_CODES, empty_events, events_to_dicts, events_from_dicts, events_to_frame,
+                        to_records, from_records)
+
+MARKER = '_store.json'
+
+
+def is_store(store_path):
+    return os.path.isfile(os.path.join(store_path, MARKER))
+
+
+def store_columns(store_path):
+    with open(os.path.join(store_path, MARKER)) as f:
+        return json.load(f)['columns']
+
+
+def write_store(store_path, nested, columns=EVENT_COLUMNS):
+    """Write nested [pid][run][phase] = event set, replacing any store already at store_path."""
+    if os.path.exists(store_path):
+        if not is_store(store_path):
+            raise ValueError(f"{store_path} exists and is not an event store; not overwriting it")
+        shutil.rmtree(store_path)
+    os.makedirs(store_path)
+    for pid, runs in nested.items():
+        for run, phases in runs.items():
+            for phase, events in phases.items():
+                part = os.path.join(store_path, pid, run, phase)
+                os.makedirs(part)
+                for col in columns:
+                    np.save(os.path.join(part, f"{col}.npy"), events[col])
+    # Marker last: a half-written store is not picked up by loaders
+    with open(os.path.join(store_path, MARKER), 'w') as f:
+        json.dump({'columns': list(columns)}, f)
+
+
+def list_partitions(store_path, pid=None, run=None, phase=None):
+    """Sorted (pid, run, phase) partitions matching the given filters (None = all)."""
+    def entries(path, wanted):
+        if isinstance(wanted, str):
+            return [wanted] if os.path.isdir(os.path.join(path, wanted)) else []
+        names = sorted(d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d)))
+        return names if wanted is None else [d for d in names if d in wanted]
+
+    parts = []
+    for p in entries(store_path, pid):
+        for r in entries(os.path.join(store_path, p), run):
+            for ph in entries(os.path.join(store_path, p, r), phase):
+                parts.append((p, r, ph))
+    return parts
+
+
+def load_partition(store_path, pid, run, phase, columns=None, mmap=True):
+    """Event set (dict of arrays) for one partition; columns=None loads every stored column."""
+    part = os.path.join(store_path, pid, run, phase)
+    if columns is None:
+        columns = store_columns(store_path)
+    mode = 'r' if mmap else None
+    return {col: np.load(os.path.join(part, f"{col}.npy"), mmap_mode=mode) for col in columns}
+
+
+def load_events(store_path, pid=None, run=None, phase=None, columns=None, mmap=True):
+    """Nested [pid][run][phase] = event set for the matching partitions only."""
+    if columns is not None:
+        missing = [col for col in columns if col not in store_columns(store_path)]
+        if missing:
+            raise ValueError(f"{store_path} has no column(s) {missing}")
+    nested = {}
+    for p, r, ph in list_partitions(store_path, pid, run, phase):
+        nested.setdefault(p, {}).setdefault(r, {})[ph] = load_partition(store_path, p, r, ph, columns, mmap)
+    return nested
+
+
+def to_legacy(nested):
+    """Nested event sets -> the old pickle format (lists of event dicts)."""
+    legacy = {}
+    for pid, runs in nested.items():
+        legacy[pid] = {}
+        for run, phases in runs.items():
+            legacy[pid][run] = {}
+            for phase, events in phases.items():
+                full = empty_events(len(events['start']))
+                full.update(events)
+                legacy[pid][run][phase] = events_to_dicts(full, with_artifact='is_artifact' in events)
+    return legacy
+
+
+def from_legacy(legacy):
+    """Old pickle format -> nested event sets."""
+    return {pid: {run: {phase: events_from_dicts(dicts) for phase, dicts in phases.items()}
+                  for run, phases in runs.items()}
+            for pid, runs in legacy.items()}
+
+
+def store_to_pickle(store_path, pkl_path):
+    columns = store_columns(store_path)
+    nested = load_events(store_path, columns=columns, mmap=False)
+    with open(pkl_path, 'wb') as f:
+        pickle.dump(to_legacy(nested), f)
+
+
+def pickle_to_store(pkl_path, store_path):
+    with open(pkl_path, 'rb') as f:
+        legacy = pickle.load(f)
+    has_artifact = any('is_artifact' in ev for runs in legacy.values() for phases in runs.values()
+                       for dicts in phases.values() for ev in dicts[:1])
+    columns = EVENT_COLUMNS if has_artifact else tuple(c for c in EVENT_COLUMNS if c != 'is_artifact')
+    write_store(store_path, from_legacy(legacy), columns)
+
+
+def save_records(npz_path, nested):
+    """Write nested event sets to one .npz of EVENT_DTYPE record arrays keyed 'pid/run/phase'."""
+    arrays = {f"{pid}/{run}/{phase}": to_records(events)
+              for pid, runs in nested.items() for run, phases in runs.items() for phase, events in phases.items()}
+    np.savez(npz_path, **arrays)
+
+
+def load_records(npz_path, pid=None, run=None, phase=None):
+    """Nested [pid][run][phase] = record array from a save_records() file (matching keys only)."""
+    nested = {}
+    with np.load(npz_path) as npz:
+        for key in sorted(npz.files):
+            p, r, ph = key.split('/')
+            if pid not in (None, p) or run not in (None, r) or phase not in (None, ph):
+                continue
+            nested.setdefault(p, {}).setdefault(r, {})[ph] = npz[key]
+    return nested
+
+
+def load_any(path, pid=None, run=None, phase=None, columns=None):
+    """Nested [pid][run][phase] = event set from an event store, a records .npz or a legacy .pkl."""
+    if os.path.isdir(path):
+        return load_events(path, pid, run, phase, columns)
+    if path.endswith('.npz'):
+        nested = {p: {r: {ph: from_records(rec) for ph, rec in phases.items()} for r, phases in runs.items()}
+                  for p, runs in load_records(path, pid, run, phase).items()}
+    else:
+        with open(path, 'rb') as f:
+            legacy = pickle.load(f)
+        nested = {}
+        for p, runs in legacy.items():
+            for r, phases in runs.items():
+                for ph, dicts in phases.items():
+                    if pid in (None, p) and run in (None, r) and phase in (None, ph):
+                        nested.setdefault(p, {}).setdefault(r, {})[ph] = events_from_dicts(dicts)
+        # Unflagged pickles have no is_artifact key: drop the all-False column events_from_dicts fills in
+        if not any('is_artifact' in ev for runs in legacy.values() for phases in runs.values()
+                   for dicts in phases.values() for ev in dicts[:1]):
+            for runs in nested.values():
+                for phases in runs.values():
+                    for events in phases.values():
+                        events.pop('is_artifact', None)
+    if columns is not None:
+        nested = {p: {r: {ph: {col: events[col] for col in columns} for ph, events in phases.items()}
+                      for r, phases in runs.items()} for p, runs in nested.items()}
+    return nested
+
+
+def event_columns(path):
+    """Columns available in an event store, records .npz (always every column) or legacy .pkl."""
+    return EventStore(path).columns
+
+
+def _as_set(value):
+    return None if value is None else {value} if isinstance(value, str) else set(value)
+
+
+class EventStore:
+    """Query interface over an event store directory (or, loaded whole, a records .npz / legacy .pkl).
+    pid, run, phase and type take one value or a list; artifact True/False keeps only flagged/clean
+    events; t_range=(a, b) keeps events starting in [a, b) (partitions are sorted by start)."""
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self._nested = None if is_store(path) else load_any(path)
+
+    @property
+    def columns(self):
+        if self._nested is None:
+            return list(store_columns(self.path))
+        for runs in self._nested.values():
+            for phases in runs.values():
+                for events in phases.values():
+                    return list(events)
+        return list(EVENT_COLUMNS)
+
+    def partitions(self, pid=None, run=None, phase=None):
+        """(pid, run, phase) of the partitions matching the filters, without reading any data."""
+        if self._nested is None:
+            return list_partitions(self.path, pid, run, phase)
+        pids, runs, phases = _as_set(pid), _as_set(run), _as_set(phase)
+        return [(p, r, ph) for p in sorted(self._nested) if pids is None or p in pids
+                for r in sorted(self._nested[p]) if runs is None or r in runs
+                for ph in sorted(self._nested[p][r]) if phases is None or ph in phases]
+
+    def _column(self, part, col):
+        if self._nested is None:
+            return np.load(os.path.join(self.path, *part, f"{col}.npy"), mmap_mode='r')
+        pid, run, phase = part
+        return self._nested[pid][run][phase][col]
+
+    def _rows(self, part, type_codes, artifact, t_range):
+        """Rows of one partition passing the filters: a slice when only t_range applies, else indices."""
+        start = self._column(part, 'start')
+        lo, hi = 0, len(start)
+        if t_range is not None:
+            lo, hi = np.searchsorted(start, t_range, side='left')
+        mask = None
+        if type_codes is not None:
+            mask = np.isin(self._column(part, 'type')[lo:hi], type_codes)
+        if artifact is not None:
+            keep = np.asarray(self._column(part, 'is_artifact')[lo:hi], dtype=bool) == artifact
+            mask = keep if mask is None else mask & keep
+        return slice(lo, hi) if mask is None else lo + np.flatnonzero(mask)
+
+    def query(self, pid=None, run=None, phase=None, type=None, artifact=None, t_range=None, columns=None,
+              frame=True):
+        """Matching events as one DataFrame (with pid/run/phase columns) or, with frame=False, nested
+        [pid][run][phase] event sets (memory-mapped views when only t_range is used on a store)."""
+        stored = self.columns
+        columns = stored if columns is None else list(columns)
+        needed = set(columns) | {'start'} | ({'type'} if type is not None else set())
+        if artifact is not None:
+            needed.add('is_artifact')
+        missing = sorted(needed - set(stored))
+        if missing:
+            raise ValueError(f"{self.path} has no column(s) {missing}")
+        type_codes = None if type is None else [TYPE_CODES[name] for name in _as_set(type)]
+
+        nested = {}
+        for part in self.partitions(pid, run, phase):
+            rows = self._rows(part, type_codes, artifact, t_range)
+            events = {col: self._column(part, col)[rows] for col in columns}
+            p, r, ph = part
+            nested.setdefault(p, {}).setdefault(r, {})[ph] = events
+        if not frame:
+            return nested
+
+        import pandas as pd
+        frames = []
+        for p, runs in nested.items():
+            for r, phases in runs.items():
+                for ph, events in phases.items():
+                    df = events_to_frame(events)
+                    df.insert(0, 'phase', ph)
+                    df.insert(0, 'run', r)
+                    df.insert(0, 'pid', p)
+                    frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=['pid', 'run', 'phase'] + columns)
+        return pd.concat(frames, ignore_index=True)
+
+
+def load_legacy(path):
+    """Old-format nested dicts from either a store directory or a .pkl file."""
+    if os.path.isdir(path):
+        return to_legacy(load_events(path, mmap=False))
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] not in ('to-pickle', 'from-pickle', 'to-records'):
+        print("usage: python event_store.py to-pickle <store> <out.pkl> | from-pickle <in.pkl> <store>"
+              " | to-records <store|in.pkl> <out.npz>")
+        sys.exit(1)
+    if sys.argv[1] == 'to-pickle':
+        store_to_pickle(sys.argv[2], sys.argv[3])
+    elif sys.argv[1] == 'to-records':
+        save_records(sys.argv[3], load_any(sys.argv[2]))
+    else:
+        pickle_to_store(sys.argv[2], sys.argv[3])
+    print(f"Wrote {sys.argv[3]}")
@@ -0,0 +1,129 @@
+'''
+Per-session result cache for the extraction scripts, so a rerun only redoes new or changed sessions.
+Key = NWB file fingerprint (absolute path, size, mtime, optional SHA-256 of the content) plus the
+extraction parameters (worker name and any settings). Entries are pickles in pkl/cache/<name>/
+holding the worker result and how long it took, which is reported as time saved on a hit.
+'''
+import os
+import json
+import time
+import pickle
+import hashlib
+from functools import partial
+from sessions import run_sessions
+
+# Bump when the extraction output format changes so old entries are not reused
+CACHE_VERSION = 1
+
+
+def file_fingerprint(path, content_hash=False):
+    st = os.stat(path)
+    fp = {'path': os.path.abspath(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if content_hash:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        fp['sha256'] = h.hexdigest()
+    return fp
+
+
+def add_cache_arguments(parser):
+    parser.add_argument('--no-cache', action='store_true', help='recompute every session')
+    parser.add_argument('--hash', action='store_true', help='also key the cache on a content hash (slower)')
+
+
+class SessionCache:
+    def __init__(self, cache_dir, params, content_hash=False, enabled=True):
+        self.cache_dir = cache_dir
+        self.params = dict(params, cache_version=CACHE_VERSION)
+        self.content_hash = content_hash
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0.0
+        self._entries = {}
+        if enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_path(self, path):
+        if path not in self._entries:  # fingerprint (and content hash) once per run
+            key = {'file': file_fingerprint(path, self.content_hash), 'params': self.params}
+            digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+            self._entries[path] = os.path.join(self.cache_dir, f"{digest}.pkl")
+        return self._entries[path]
+
+    def load(self, path):
+        """(True, result) on a hit, (False, None) otherwise."""
+        if self.enabled:
+            entry = self.entry_path(path)
+            if os.path.exists(entry):
+                try:
+                    with open(entry, 'rb') as f:
+                        cached = pickle.load(f)
+                    self.hits += 1
+                    self.time_saved += cached['elapsed']
+                    return True, cached['result']
+                except Exception:
+                    pass  # unreadable entry: recompute and overwrite
+        self.misses += 1
+        return False, None
+
+    def store(self, path, result, elapsed):
+        if not self.enabled:
+            return
+        entry = self.entry_path(path)
+        tmp = entry + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump({'result': result, 'elapsed': elapsed}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, entry)
+
+    def summary(self):
+        if not self.enabled:
+            return "Cache: disabled"
+        return f"Cache: {self.hits} hits, {self.misses} misses, ~{self.time_saved:.1f}s saved"
+
+
+def _timed(func, path, *args):
+    t0 = time.perf_counter()
+    result = func(path, *args)
+    return result, time.perf_counter() - t0
+
+
+def _timed_load(load, path):
+    t0 = time.perf_counter()
+    loaded = load(path)
+    return loaded, time.perf_counter() - t0
+
+
+def _timed_compute(func, timed_loaded, *args):
+    """func on a _timed_load() result; elapsed covers the load and the computation, like _timed."""
+    loaded, load_elapsed = timed_loaded
+    result, elapsed = _timed(func, loaded, *args)
+    return result, load_elapsed + elapsed
+
+
+def run_cached(func, paths, cache, jobs=1, args=(), load=None, prefetch=0):
+    """Like run_sessions(), but cached sessions are reused and only misses are sent to the workers."""
+    done = {}
+    misses = []
+    for path in paths:
+        hit, result = cache.load(path)
+        if hit:
+            done[path] = (result, None)
+        else:
+            misses.append(path)
+    if load is None:
+        timed = run_sessions(partial(_timed, func), misses, jobs, args)
+    else:
+        timed = run_sessions(partial(_timed_compute, func), misses, jobs, args, partial(_timed_load, load), prefetch)
+    for path, out, error in timed:
+        if error is None:
+            result, elapsed = out
+            cache.store(path, result, elapsed)
+            done[path] = (result, None)
+        else:
+            done[path] = (None, error)
+    for path in paths:
+        result, error = done[path]
+        yield path, result, error
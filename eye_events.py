@@ -0,0 +1,199 @@
+'''
+Columnar (struct-of-arrays) event extraction shared by the extraction scripts.
+Each event set is a dict of equal-length NumPy arrays instead of one dict per event:
+-> start, end, duration, amplitude, velocity, pupil_size, is_artifact, type
+type is a small integer code into EVENT_TYPES ('Saccade', 'Fixation', 'Blink').
+Columns that do not apply to an event type are NaN (e.g. pupil_size for saccades).
+events_to_dicts() converts back to the legacy list-of-dicts used in the pickles.
+EVENT_DTYPE is the packed row form of the same columns (50 bytes per event, vs ~390 for an event
+dict); to_records()/from_records() convert between the two without changing any value.
+'''
+import numpy as np
+import profiling
+from nwb_reader import read_timeseries
+
+EVENT_TYPES = ('Saccade', 'Fixation', 'Blink')
+TYPE_CODES = {name: code for code, name in enumerate(EVENT_TYPES)}
+
+FLOAT_COLUMNS = ('start', 'end', 'duration', 'amplitude', 'velocity', 'pupil_size')
+EVENT_COLUMNS = FLOAT_COLUMNS + ('is_artifact', 'type')
+
+# One event as a packed record: float64 times/metrics, bool artifact bit, uint8 type code
+EVENT_DTYPE = np.dtype([(col, np.float64) for col in FLOAT_COLUMNS] + [('is_artifact', np.bool_), ('type', np.uint8)])
+
+# Column index in TimeSeries.data per event type (Blink data is 1D: duration only)
+DATA_COLUMNS = {
+    'Saccade': {'duration': 0, 'amplitude': 5, 'velocity': 6},
+    'Fixation': {'duration': 0, 'pupil_size': 3},
+    'Blink': {'duration': 0},
+}
+
+# Keys each event type carries in the legacy dicts (besides start/end/duration)
+LEGACY_KEYS = {
+    'Saccade': ('amplitude', 'velocity'),
+    'Fixation': ('pupil_size',),
+    'Blink': (),
+}
+
+
+def empty_events(n=0, name='Saccade'):
+    """Event set of length n with NaN metrics, is_artifact False and type set to name."""
+    events = {col: np.full(n, np.nan) for col in FLOAT_COLUMNS}
+    events['is_artifact'] = np.zeros(n, dtype=bool)
+    events['type'] = np.full(n, TYPE_CODES[name], dtype=np.uint8)
+    return events
+
+
+def events_from_columns(name, timestamps, values):
+    """Build an event set from timestamps and {column: array} (at least 'duration')."""
+    timestamps = np.asarray(timestamps, dtype=np.float64).ravel()
+    events = empty_events(len(timestamps), name)
+    for col, arr in values.items():
+        events[col] = np.asarray(arr, dtype=np.float64)[:len(timestamps)]
+    events['start'] = timestamps
+    events['end'] = timestamps + events['duration']
+    return events
+
+
+def events_from_arrays(name, timestamps, data):
+    """Build an event set from raw TimeSeries timestamps and the full data matrix."""
+    data = np.asarray(data)
+    if data.ndim == 1:
+        data = data[:, np.newaxis]
+    return events_from_columns(name, timestamps, {col: data[:, idx] for col, idx in DATA_COLUMNS[name].items()})
+
+
+def get_event_arrays(beh_module, name, t_window=None):
+    """Event set for Saccade/Fixation/Blink from the behavior processing module (empty if missing).
+    Only the mapped data columns are read; t_window=(t0, t1) skips rows starting outside it."""
+    if name not in beh_module.data_interfaces:
+        return empty_events(0, name)
+    with profiling.stage(f'read:{name}'):
+        ts = beh_module[name]['TimeSeries']
+        cols = DATA_COLUMNS[name]
+        timestamps, data = read_timeseries(ts, list(cols.values()), t_window)
+        events = events_from_columns(name, timestamps, dict(zip(cols, data.T)))
+    profiling.count(name, len(timestamps))
+    return events
+
+
+def get_encoding_recognition_windows(nwb, full_path=None):
+    """Encoding/recognition windows from trials (sorted by start_time: row 0 = encoding, rest = recognition).
+    With full_path, windows validated by `nwb_eyetracking.py check` (phase_index.py) are reused."""
+    if full_path is not None:
+        from phase_index import indexed_windows
+        windows = indexed_windows(full_path)
+        if windows is not None:
+            return windows
+    with profiling.stage('read:trials'):
+        trials = nwb.intervals['trials']
+        starts = np.asarray(trials['start_time'].data[:])
+        stops = np.asarray(trials['stop_time'].data[:])
+    order = np.argsort(starts)
+    starts, stops = starts[order], stops[order]
+    enco_start, enco_stop = float(starts[0]), float(stops[0])
+    reco_start, reco_stop = float(starts[1]), float(stops[-1])
+    return (enco_start, enco_stop), (reco_start, reco_stop)
+
+
+def phase_span(enco_window, reco_window):
+    """(t0, t1) covering both phase windows: events fully inside a phase start inside this span."""
+    return min(enco_window[0], reco_window[0]), max(enco_window[1], reco_window[1])
+
+
+def n_events(events):
+    return len(events['start'])
+
+
+def take(events, idx):
+    """Subset (boolean mask or index array) of every column."""
+    return {col: arr[idx] for col, arr in events.items()}
+
+
+def concat_events(*event_sets):
+    """Concatenate event sets column by column (order preserved)."""
+    if not event_sets:
+        return empty_events(0)
+    return {col: np.concatenate([ev[col] for ev in event_sets]) for col in EVENT_COLUMNS}
+
+
+def sort_by_start(events):
+    """Stable sort by start time (ties keep their input order, like list.sort)."""
+    with profiling.stage('sort'):
+        return take(events, np.argsort(events['start'], kind='stable'))
+
+
+def phase_masks(events, enco_window, reco_window):
+    """Masks for events fully inside encoding or (otherwise) fully inside recognition."""
+    enco_start, enco_stop = enco_window
+    reco_start, reco_stop = reco_window
+    s, e = events['start'], events['end']
+    in_enco = (enco_start <= s) & (e <= enco_stop)
+    in_reco = ~in_enco & (reco_start <= s) & (e <= reco_stop)
+    return in_enco, in_reco
+
+
+def split_by_phase(events, enco_window, reco_window):
+    """(encoding_events, recognition_events): only events fully inside one of the two windows."""
+    with profiling.stage('split'):
+        in_enco, in_reco = phase_masks(events, enco_window, reco_window)
+        enc, rec = take(events, in_enco), take(events, in_reco)
+    profiling.count('encoding_events', len(enc['start']))
+    profiling.count('recognition_events', len(rec['start']))
+    return enc, rec
+
+
+def to_records(events):
+    """Columnar event set -> structured array of EVENT_DTYPE (columns missing from events keep their defaults)."""
+    records = np.zeros(n_events(events), dtype=EVENT_DTYPE)
+    for col in FLOAT_COLUMNS:
+        records[col] = events[col] if col in events else np.nan
+    for col in ('is_artifact', 'type'):
+        if col in events:
+            records[col] = events[col]
+    return records
+
+
+def from_records(records):
+    """Structured array of EVENT_DTYPE -> columnar event set (field views, no copy)."""
+    return {col: records[col] for col in EVENT_COLUMNS}
+
+
+def events_to_frame(events):
+    """pandas DataFrame of an event set, with type decoded to its name."""
+    import pandas as pd
+    df = pd.DataFrame({col: np.asarray(arr) for col, arr in events.items()})
+    if 'type' in df.columns:
+        df['type'] = np.asarray(EVENT_TYPES)[df['type'].to_numpy()]
+    return df
+
+
+def events_to_dicts(events, with_artifact=False):
+    """Legacy list-of-dicts: type, start, end, duration + type-specific keys (+ is_artifact).
+    Columns missing from the set (e.g. is_artifact in detected events) are left out of the dicts."""
+    cols = {col: events[col].tolist() for col in EVENT_COLUMNS if col in events}
+    dicts = []
+    for i in range(n_events(events)):
+        name = EVENT_TYPES[cols['type'][i]]
+        ev = {'start': cols['start'][i], 'end': cols['end'][i], 'duration': cols['duration'][i]}
+        if name != 'Blink':
+            ev['type'] = name
+        for key in LEGACY_KEYS[name]:
+            if key in cols:
+                ev[key] = cols[key][i]
+        if with_artifact and 'is_artifact' in cols:
+            ev['is_artifact'] = cols['is_artifact'][i]
+        dicts.append(ev)
+    return dicts
+
+
+def events_from_dicts(dicts):
+    """Inverse of events_to_dicts (dicts without 'type' are treated as blinks)."""
+    events = empty_events(len(dicts))
+    for i, ev in enumerate(dicts):
+        events['type'][i] = TYPE_CODES[ev.get('type', 'Blink')]
+        for col in FLOAT_COLUMNS:
+            if col in ev:
+                events[col][i] = ev[col]
+        events['is_artifact'][i] = bool(ev.get('is_artifact', False))
+    return events
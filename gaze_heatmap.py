@@ -0,0 +1,224 @@
+'''
+Gaze heatmaps and fixation density maps per patient, for each phase and for correct vs incorrect
+recognition trials, without loading the raw gaze stream:
+-> gaze maps: EyeTracking samples are streamed chunk by chunk (gaze_stream.iter_gaze_chunks), every sample
+   is routed to its phase (encoding wins if both windows match) and, inside a recognition trial, to the
+   trial's outcome (searchsorted on the sorted trial starts), and binned into a fixed screen grid with one
+   bincount per chunk, so a worker only ever holds one chunk plus the (map, x, y) count arrays
+-> fixation maps: fixation positions (Fixation data columns 1, 2) weighted by duration (dwell time, s),
+   routed by fixation start the same way
+Sessions run in a process pool (--jobs); the per-session partial histograms are summed per patient in
+the main process (the grid is fixed by --extent/--bins, so partial maps always add up).
+pkl/gaze_heatmaps/<pid>.npz (and cohort.npz, all patients summed) has 'maps', 'x_edges', 'y_edges',
+'gaze' (maps x nx x ny sample counts), 'fixation' (dwell seconds), 'samples' / 'fixation_samples'
+(maps x [inside, outside, missing] counts) and 'sessions'. Figures go to plots/Heatmap_<pid>.png (rows: gaze, fixation; one column per map,
+each normalised to a fraction of its samples / dwell time).
+'''
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import config
+from nwb_session import open_nwb
+from nwb_reader import read_timeseries
+from eye_events import get_encoding_recognition_windows
+from gaze_stream import gaze_series, iter_gaze_chunks, DEFAULT_CHUNK_ROWS
+from pipeline import IGNORE_PATIENTS
+from sessions import find_sessions, session_key, run_sessions, add_jobs_argument
+
+data_path = config.data_path
+output_folder = config.pkl_folder
+plot_folder = config.plot_folder
+
+MAPS = ('Encoding', 'Recognition', 'Correct', 'Incorrect')
+# Screen area (x0, x1, y0, y1) in gaze units (px) and grid size; samples outside are counted, not binned
+DEFAULT_EXTENT = (0.0, 1920.0, 0.0, 1080.0)
+DEFAULT_BINS = (96, 54)
+SAMPLE_FIELDS = ('inside', 'outside', 'missing')
+
+
+class HeatmapAccumulator:
+    """(map, x bin, y bin) sums on a fixed grid, merged chunk by chunk with one bincount per routing."""
+    def __init__(self, extent=DEFAULT_EXTENT, bins=DEFAULT_BINS, dtype=np.int64):
+        self.extent = tuple(float(v) for v in extent)
+        self.bins = tuple(int(b) for b in bins)
+        self.n_cells = self.bins[0] * self.bins[1]
+        self.grid = np.zeros(len(MAPS) * self.n_cells, dtype=dtype)
+        self.samples = np.zeros((len(MAPS), len(SAMPLE_FIELDS)), dtype=np.int64)
+
+    def cells(self, x, y):
+        """Flat grid cell per point, -1 outside the extent, -2 for missing (NaN) positions."""
+        x0, x1, y0, y1 = self.extent
+        nx, ny = self.bins
+        with np.errstate(invalid='ignore'):
+            ix = np.floor((x - x0) / (x1 - x0) * nx)
+            iy = np.floor((y - y0) / (y1 - y0) * ny)
+            inside = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+        flat = np.where(inside, ix * ny + iy, -1)
+        flat[np.isnan(x) | np.isnan(y)] = -2
+        return flat.astype(np.int64)
+
+    def add(self, x, y, codes, weights=None):
+        """Add points to the maps given by each array in codes (MAPS index per point, -1 = none)."""
+        flat = self.cells(x, y)
+        status = np.where(flat >= 0, 0, np.where(flat == -1, 1, 2))
+        for code in codes:
+            routed = code >= 0
+            self.samples += np.bincount(code[routed] * len(SAMPLE_FIELDS) + status[routed],
+                                        minlength=self.samples.size).reshape(self.samples.shape)
+            keep = routed & (flat >= 0)
+            w = None if weights is None else weights[keep]
+            self.grid += np.bincount(code[keep] * self.n_cells + flat[keep], weights=w,
+                                     minlength=self.grid.size).astype(self.grid.dtype)
+
+    def result(self):
+        return self.grid.reshape(len(MAPS), *self.bins), self.samples
+
+
+def route(t, enco_window, reco_window, trial_starts, trial_stops, trial_correct):
+    """(phase code, outcome code) per time: MAPS index or -1. Windows and trials are inclusive;
+    trials are the sorted, non-overlapping recognition trials."""
+    phase = np.full(len(t), -1, dtype=np.int64)
+    phase[(t >= reco_window[0]) & (t <= reco_window[1])] = 1
+    phase[(t >= enco_window[0]) & (t <= enco_window[1])] = 0
+    outcome = np.full(len(t), -1, dtype=np.int64)
+    if len(trial_starts):
+        k = np.searchsorted(trial_starts, t, side='right') - 1
+        kc = np.maximum(k, 0)
+        in_trial = (k >= 0) & (t <= trial_stops[kc])
+        correct = trial_correct[kc]
+        outcome[in_trial & (correct == 1)] = MAPS.index('Correct')
+        outcome[in_trial & (correct == 0)] = MAPS.index('Incorrect')
+    return phase, outcome
+
+
+def recognition_trials(nwb):
+    """(starts, stops, response_correct) of the recognition trials (rows after the first, by start time)."""
+    table = nwb.intervals['trials']
+    starts = np.asarray(table['start_time'].data[:], dtype=np.float64)
+    stops = np.asarray(table['stop_time'].data[:], dtype=np.float64)
+    if 'response_correct' in table.colnames:
+        correct = np.asarray(table['response_correct'].data[:], dtype=np.float64)
+    else:
+        correct = np.full(len(starts), np.nan)
+    order = np.argsort(starts, kind='stable')[1:]
+    return starts[order], stops[order], correct[order]
+
+
+def session_heatmaps(full_path, extent=DEFAULT_EXTENT, bins=DEFAULT_BINS, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Partial maps of one session: {'gaze', 'gaze_samples', 'fixation', 'fixation_samples'}."""
+    gaze = HeatmapAccumulator(extent, bins)
+    fixation = HeatmapAccumulator(extent, bins, dtype=np.float64)
+    with open_nwb(full_path) as nwb:
+        enco_window, reco_window = get_encoding_recognition_windows(nwb, full_path)
+        trials = recognition_trials(nwb)
+        span = (min(enco_window[0], reco_window[0]), max(enco_window[1], reco_window[1]))
+        beh = nwb.processing['behavior']
+        if 'EyeTracking' in beh.data_interfaces:
+            for chunk in iter_gaze_chunks(gaze_series(nwb), chunk_rows, span):
+                gaze.add(chunk['x'], chunk['y'], route(chunk['t'], enco_window, reco_window, *trials))
+        if 'Fixation' in beh.data_interfaces:
+            t, data = read_timeseries(beh['Fixation']['TimeSeries'], [0, 1, 2], span)
+            fixation.add(data[:, 1], data[:, 2], route(t, enco_window, reco_window, *trials),
+                         weights=np.nan_to_num(data[:, 0]))
+    (gaze_grid, gaze_samples), (fix_grid, fix_samples) = gaze.result(), fixation.result()
+    return {'gaze': gaze_grid, 'gaze_samples': gaze_samples, 'fixation': fix_grid, 'fixation_samples': fix_samples}
+
+
+def add_maps(total, result):
+    """Sum of two partial map sets (session results or already merged totals)."""
+    result = dict(result, sessions=result.get('sessions', 1))
+    if total is None:
+        return result
+    return {key: total[key] + result[key] for key in result}
+
+
+def save_maps(path, maps, extent, bins):
+    """Compact npz: counts as uint32, dwell time as float32."""
+    np.savez_compressed(
+        path, maps=np.asarray(MAPS), sessions=maps['sessions'],
+        x_edges=np.linspace(extent[0], extent[1], bins[0] + 1), y_edges=np.linspace(extent[2], extent[3], bins[1] + 1),
+        gaze=maps['gaze'].astype(np.uint32), fixation=maps['fixation'].astype(np.float32),
+        samples=maps['gaze_samples'], fixation_samples=maps['fixation_samples'])
+
+
+def render_heatmaps(npz_path, out_path):
+    """Worker: one figure per npz, rows gaze / fixation dwell, one column per map (fraction per cell)."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    with np.load(npz_path) as f:
+        maps, x_edges, y_edges = list(f['maps']), f['x_edges'], f['y_edges']
+        rows = (('Gaze samples', f['gaze'].astype(np.float64)), ('Fixation dwell time', f['fixation'].astype(np.float64)))
+    extent = (x_edges[0], x_edges[-1], y_edges[-1], y_edges[0])
+    fig, axes = plt.subplots(len(rows), len(maps), figsize=(4 * len(maps), 2.8 * len(rows)), squeeze=False)
+    for r, (label, grids) in enumerate(rows):
+        for m, name in enumerate(maps):
+            ax = axes[r, m]
+            total = grids[m].sum()
+            density = grids[m] / total if total > 0 else np.zeros_like(grids[m])
+            # Screen y grows downwards: y edges top to bottom
+            im = ax.imshow(density.T, origin='upper', extent=extent, cmap='inferno', aspect='auto')
+            if r == 0:
+                ax.set_title(name)
+            ax.set_xticks([])
+            ax.set_yticks([])
+            if m == 0:
+                ax.set_ylabel(label)
+            fig.colorbar(im, ax=ax, fraction=0.046, pad=0.02)
+    fig.suptitle(os.path.splitext(os.path.basename(npz_path))[0])
+    fig.tight_layout()
+    fig.savefig(out_path)
+    plt.close(fig)
+    return out_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Streaming gaze heatmaps and fixation density maps.')
+    add_jobs_argument(parser)
+    parser.add_argument('--extent', type=float, nargs=4, default=DEFAULT_EXTENT, metavar=('X0', 'X1', 'Y0', 'Y1'),
+                        help='screen area binned (gaze units)')
+    parser.add_argument('--bins', type=int, nargs=2, default=DEFAULT_BINS, metavar=('NX', 'NY'))
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='gaze samples per read')
+    parser.add_argument('--no-plots', action='store_true', help='only write the arrays')
+    args = parser.parse_args()
+    extent, bins = tuple(args.extent), tuple(args.bins)
+
+    paths = [p for p in find_sessions(data_path) if session_key(p)[0] not in IGNORE_PATIENTS]
+    print(f"Binning gaze of {len(paths)} sessions into a {bins[0]}x{bins[1]} grid...\n")
+    totals = {}
+    for full_path, result, error in run_sessions(session_heatmaps, paths, args.jobs, (extent, bins, args.chunk_rows)):
+        pid, run_key = session_key(full_path)
+        if error is not None:
+            print(f"Error in {pid} ({run_key}): {error}")
+            continue
+        totals[pid] = add_maps(totals.get(pid), result)
+        inside, outside, missing = result['gaze_samples'].sum(axis=0)
+        print(f"{pid} ({run_key}): {inside} gaze samples binned, {outside} off-screen, {missing} missing")
+    if totals:
+        cohort = None
+        for pid in sorted(totals):
+            cohort = add_maps(cohort, totals[pid])
+        totals['cohort'] = cohort
+
+    out_dir = os.path.join(output_folder, 'gaze_heatmaps')
+    os.makedirs(out_dir, exist_ok=True)
+    saved = []
+    for name, maps in totals.items():
+        path = os.path.join(out_dir, f"{name}.npz")
+        save_maps(path, maps, extent, bins)
+        saved.append((path, os.path.join(plot_folder, f"Heatmap_{name}.png")))
+    print(f"\nHeatmap arrays saved to: {out_dir}")
+
+    if saved and not args.no_plots:
+        os.makedirs(plot_folder, exist_ok=True)
+        jobs = (os.cpu_count() or 1) if args.jobs == 0 else args.jobs
+        if jobs <= 1 or len(saved) == 1:
+            for a in saved:
+                render_heatmaps(*a)
+        else:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(saved))) as pool:
+                for fut in [pool.submit(render_heatmaps, *a) for a in saved]:
+                    fut.result()
+        print(f"{len(saved)} heatmap figures saved to: {plot_folder}")
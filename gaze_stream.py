@@ -0,0 +1,198 @@
+'''
+Streaming processor for the raw EyeTracking SpatialSeries (processing/behavior/EyeTracking/SpatialSeries).
+The raw gaze stream is millions of samples per session, so it is never loaded whole:
+-> iter_gaze_chunks() yields bounded chunks {'t', 'x', 'y'[, 'pupil']} straight from the HDF5 dataset
+   (times from the timestamps dataset or from starting_time + rate), optionally limited to a time window
+   located by binary search on disk
+-> window_stats() reduces the stream into per-window count, mean position, spread and pupil, keeping only
+   (count, mean, M2) accumulators per window (chunks are merged with Chan's parallel variance update)
+Run directly to write per-trial gaze stats for every session to pkl/gaze_trial_stats.csv.
+'''
+import os
+import config
+import csv
+import argparse
+import numpy as np
+import profiling
+from nwb_session import open_nwb
+from sessions import find_sessions, session_key, run_sessions, add_jobs_argument
+
+data_path = config.data_path
+output_folder = config.pkl_folder
+
+DEFAULT_CHUNK_ROWS = 1 << 18
+# Column order of SpatialSeries.data: X, Y and (if present) pupil
+GAZE_COLUMNS = ('x', 'y', 'pupil')
+STAT_FIELDS = ('n_samples', 'n_missing', 'mean_x', 'mean_y', 'std_x', 'std_y', 'dispersion', 'mean_pupil')
+
+
+def gaze_series(nwb):
+    return nwb.processing['behavior']['EyeTracking'].spatial_series['SpatialSeries']
+
+
+def _first_row_at_or_after(times, t, n, side='left'):
+    """Binary search over a sorted on-disk timestamps dataset, reading one value per step."""
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        v = float(times[mid])
+        if v < t or (side == 'right' and v == t):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def window_row_range(series, t_window):
+    """[lo, hi) rows of the series with sample times inside t_window (inclusive)."""
+    n = series.data.shape[0]
+    if t_window is None:
+        return 0, n
+    t0, t1 = t_window
+    if series.timestamps is None:
+        start, rate = series.starting_time or 0.0, series.rate
+        lo = int(np.clip(np.ceil((t0 - start) * rate), 0, n))
+        hi = int(np.clip(np.floor((t1 - start) * rate) + 1, lo, n))
+        # (t - start) * rate can round across an integer; settle on the times iter_gaze_chunks computes
+        if lo > 0 and start + (lo - 1) / rate >= t0:
+            lo -= 1
+        if hi < n and start + hi / rate <= t1:
+            hi += 1
+        return lo, max(lo, hi)
+    lo = _first_row_at_or_after(series.timestamps, t0, n)
+    hi = _first_row_at_or_after(series.timestamps, t1, n, side='right')
+    return lo, max(lo, hi)
+
+
+def iter_gaze_chunks(series, chunk_rows=DEFAULT_CHUNK_ROWS, t_window=None):
+    """Yield {'t', 'x', 'y'[, 'pupil']} float64 chunks of at most chunk_rows samples."""
+    lo, hi = window_row_range(series, t_window)
+    n_cols = 1 if len(series.data.shape) == 1 else series.data.shape[1]
+    for start in range(lo, hi, chunk_rows):
+        stop = min(start + chunk_rows, hi)
+        with profiling.stage('read:gaze'):
+            block = np.asarray(series.data[start:stop], dtype=np.float64).reshape(stop - start, n_cols)
+        profiling.add_bytes(getattr(series.data, 'name', None) or 'gaze', block.size * series.data.dtype.itemsize)
+        if series.timestamps is None:
+            t = (series.starting_time or 0.0) + np.arange(start, stop) / series.rate
+        else:
+            t = np.asarray(series.timestamps[start:stop], dtype=np.float64)
+        chunk = {'t': t}
+        for i, name in enumerate(GAZE_COLUMNS[:n_cols]):
+            chunk[name] = block[:, i]
+        yield chunk
+
+
+class WindowAccumulator:
+    """Per-window running (count, mean, M2) for each gaze column, merged chunk by chunk."""
+    def __init__(self, n_windows, columns=GAZE_COLUMNS):
+        self.columns = columns
+        self.n_total = np.zeros(n_windows, dtype=np.int64)
+        self.count = {c: np.zeros(n_windows, dtype=np.int64) for c in columns}
+        self.mean = {c: np.zeros(n_windows) for c in columns}
+        self.m2 = {c: np.zeros(n_windows) for c in columns}
+
+    def add(self, w, chunk, sl):
+        """Merge samples chunk[...][sl] into window w."""
+        self.n_total[w] += sl.stop - sl.start
+        for c in self.columns:
+            if c not in chunk:
+                continue
+            v = chunk[c][sl]
+            v = v[~np.isnan(v)]
+            n_b = len(v)
+            if n_b == 0:
+                continue
+            mean_b = v.mean()
+            m2_b = ((v - mean_b) ** 2).sum()
+            n_a, mean_a = self.count[c][w], self.mean[c][w]
+            n = n_a + n_b
+            delta = mean_b - mean_a
+            self.mean[c][w] = mean_a + delta * n_b / n
+            self.m2[c][w] += m2_b + delta ** 2 * n_a * n_b / n
+            self.count[c][w] = n
+
+    def result(self):
+        """{field: array over windows}: counts, means, std per axis, dispersion = sqrt(var_x + var_y)."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = {c: self.m2[c] / self.count[c] for c in self.columns}
+            mean = {c: np.where(self.count[c] > 0, self.mean[c], np.nan) for c in self.columns}
+        n_valid = self.count['x']
+        return {
+            'n_samples': n_valid,
+            'n_missing': self.n_total - n_valid,
+            'mean_x': mean['x'],
+            'mean_y': mean['y'],
+            'std_x': np.sqrt(var['x']),
+            'std_y': np.sqrt(var['y']),
+            'dispersion': np.sqrt(var['x'] + var['y']),
+            'mean_pupil': mean['pupil'],
+        }
+
+
+def window_stats(series, windows, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Gaze stats per (start, stop) window (inclusive, may overlap) in one pass over the stream.
+    Only the span covered by the windows is read."""
+    windows = np.asarray(windows, dtype=np.float64).reshape(-1, 2)
+    acc = WindowAccumulator(len(windows))
+    if len(windows) == 0:
+        return acc.result()
+    span = (windows[:, 0].min(), windows[:, 1].max())
+    for chunk in iter_gaze_chunks(series, chunk_rows, span):
+        t = chunk['t']
+        # Windows overlapping this chunk, each resolved to a contiguous sample slice
+        active = np.flatnonzero((windows[:, 0] <= t[-1]) & (windows[:, 1] >= t[0]))
+        lo = np.searchsorted(t, windows[active, 0], side='left')
+        hi = np.searchsorted(t, windows[active, 1], side='right')
+        for w, a, b in zip(active, lo, hi):
+            if b > a:
+                acc.add(w, chunk, slice(int(a), int(b)))
+    return acc.result()
+
+
+def session_trial_gaze(full_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Per-trial gaze stats for one session: list of row dicts (trials in time order)."""
+    with open_nwb(full_path) as nwb:
+        beh = nwb.processing['behavior']
+        if 'EyeTracking' not in beh.data_interfaces:
+            return []
+        trials = nwb.intervals['trials']
+        starts = np.asarray(trials['start_time'].data[:])
+        stops = np.asarray(trials['stop_time'].data[:])
+        order = np.argsort(starts)
+        phases = None
+        if 'stim_phase' in trials.colnames:
+            phases = trials.to_dataframe()['stim_phase'].to_numpy()[order]
+        stats = window_stats(gaze_series(nwb), np.column_stack([starts[order], stops[order]]), chunk_rows)
+
+    rows = []
+    for i in range(len(order)):
+        row = {'trial': i, 'phase': phases[i] if phases is not None else ('encoding' if i == 0 else 'recognition'),
+               'start': float(starts[order][i]), 'stop': float(stops[order][i])}
+        row.update({k: stats[k][i].item() for k in STAT_FIELDS})
+        rows.append(row)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-trial gaze stats from the raw EyeTracking stream.')
+    add_jobs_argument(parser)
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='samples per read')
+    args = parser.parse_args()
+
+    os.makedirs(output_folder, exist_ok=True)
+    out_path = os.path.join(output_folder, 'gaze_trial_stats.csv')
+    fields = ['pid', 'run', 'trial', 'phase', 'start', 'stop'] + list(STAT_FIELDS)
+    with open(out_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, lineterminator='\n')
+        writer.writeheader()
+        for full_path, rows, error in run_sessions(session_trial_gaze, find_sessions(data_path), args.jobs,
+                                                   (args.chunk_rows,)):
+            pid, run_key = session_key(full_path)
+            if error is not None:
+                print(f"Error in {os.path.basename(full_path)}: {error}")
+                continue
+            for row in rows:
+                writer.writerow(dict(row, pid=pid, run=run_key))
+            print(f"{pid} ({run_key}): {len(rows)} trials, {sum(r['n_samples'] for r in rows)} gaze samples")
+    print(f"\nGaze trial stats saved to: {out_path}")
@@ -0,0 +1,144 @@
+'''
+Grouped statistics over the columnar eye events and resampling tests for the Encoding vs Recognition
+comparison (used by paired_t_test.py).
+-> event_values(): one metric from every partition as flat (patient, phase, value) arrays
+-> group_summary(): count, mean and median per (patient, phase) with bincount / one lexsort
+-> paired_means(): per patient Encoding and Recognition value (mean or median) for patients with both
+-> sign_flip_test(): paired permutation test on the per-patient differences; all sign patterns are
+   enumerated when 2**n <= n_resamples (exact), otherwise n_resamples random sign vectors
+-> bootstrap_ci(): percentile CI of the mean difference from n_resamples resamples of the patients
+Resamples are drawn as (block, n_patients) matrices and reduced with one matrix product / mean per block.
+'''
+import numpy as np
+from eye_events import TYPE_CODES
+
+# metric name -> (event type, column)
+METRICS = {
+    'fixation_duration': ('Fixation', 'duration'),
+    'pupil': ('Fixation', 'pupil_size'),
+    'saccade_duration': ('Saccade', 'duration'),
+    'saccade_amplitude': ('Saccade', 'amplitude'),
+    'saccade_velocity': ('Saccade', 'velocity'),
+}
+PHASES = ('Encoding', 'Recognition')
+# Rows per resampling block (bounds memory to block * n_patients values)
+BLOCK = 1 << 14
+
+
+def metric_columns(metric, exclude_artifacts=False):
+    """Store columns needed to compute metric."""
+    columns = ['type', METRICS[metric][1]]
+    if exclude_artifacts:
+        columns.append('is_artifact')
+    return columns
+
+
+def event_values(nested, metric, exclude_artifacts=False):
+    """(patients, patient_idx, phase_idx, values) for metric over every [pid][run][phase] partition.
+    NaN values are dropped; with exclude_artifacts events flagged is_artifact are dropped too."""
+    type_name, col = METRICS[metric]
+    code = TYPE_CODES[type_name]
+    patients = sorted(nested)
+    p_idx, ph_idx, values = [], [], []
+    for i, pid in enumerate(patients):
+        for run, phases in nested[pid].items():
+            for j, phase in enumerate(PHASES):
+                if phase not in phases:
+                    continue
+                events = phases[phase]
+                keep = np.asarray(events['type']) == code
+                if exclude_artifacts:
+                    if 'is_artifact' not in events:
+                        raise ValueError("events have no is_artifact column (use the flagged_eye_events output)")
+                    keep &= ~np.asarray(events['is_artifact'], dtype=bool)
+                v = np.asarray(events[col], dtype=np.float64)[keep]
+                v = v[~np.isnan(v)]
+                values.append(v)
+                p_idx.append(np.full(len(v), i, dtype=np.int64))
+                ph_idx.append(np.full(len(v), j, dtype=np.int64))
+    if not values:
+        return patients, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    return patients, np.concatenate(p_idx), np.concatenate(ph_idx), np.concatenate(values)
+
+
+def grouped_median(group, values, n_groups):
+    """Median of values per group id in [0, n_groups) (NaN for empty groups) from one lexsort."""
+    order = np.lexsort((values, group))
+    v = values[order]
+    counts = np.bincount(group, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    has = counts > 0
+    lo = np.where(has, starts + (counts - 1) // 2, 0)
+    hi = np.where(has, starts + counts // 2, 0)
+    if len(v) == 0:
+        return np.full(n_groups, np.nan)
+    return np.where(has, (v[lo] + v[hi]) / 2, np.nan)
+
+
+def group_summary(patient_idx, phase_idx, values, n_patients):
+    """{'count', 'mean', 'median'}: (n_patients, len(PHASES)) arrays."""
+    group = patient_idx * len(PHASES) + phase_idx
+    n_groups = n_patients * len(PHASES)
+    count = np.bincount(group, minlength=n_groups)
+    total = np.bincount(group, weights=values, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+    median = grouped_median(group, values, n_groups)
+    shape = (n_patients, len(PHASES))
+    return {'count': count.reshape(shape), 'mean': mean.reshape(shape), 'median': median.reshape(shape)}
+
+
+def paired_means(nested, metric, exclude_artifacts=False, stat='mean'):
+    """(patients, encoding, recognition): per patient value of stat for patients with events in both phases."""
+    patients, p_idx, ph_idx, values = event_values(nested, metric, exclude_artifacts)
+    summary = group_summary(p_idx, ph_idx, values, len(patients))
+    both = (summary['count'] > 0).all(axis=1)
+    table = summary[stat][both]
+    return [p for p, keep in zip(patients, both) if keep], table[:, 0], table[:, 1]
+
+
+def _sign_blocks(n, n_resamples, rng):
+    """Blocks of +-1 sign matrices: every pattern when 2**n <= n_resamples, else random rows."""
+    if 2 ** n <= n_resamples:
+        codes = np.arange(2 ** n)
+        for start in range(0, len(codes), BLOCK):
+            bits = (codes[start:start + BLOCK, np.newaxis] >> np.arange(n)) & 1
+            yield 1.0 - 2.0 * bits
+        return
+    for start in range(0, n_resamples, BLOCK):
+        yield rng.choice((-1.0, 1.0), size=(min(BLOCK, n_resamples - start), n))
+
+
+def sign_flip_test(diffs, n_resamples=20000, seed=0):
+    """(mean difference, two-sided p) of the paired sign-flip permutation test on diffs.
+    Exact enumeration gives p = share of patterns at least as extreme; random sampling adds one
+    to both counts so p is never 0."""
+    diffs = np.asarray(diffs, dtype=np.float64)
+    n = len(diffs)
+    if n == 0:
+        return np.nan, np.nan
+    observed = abs(diffs.mean())
+    exact = 2 ** n <= n_resamples
+    rng = np.random.default_rng(seed)
+    hits, total = 0, 0
+    for signs in _sign_blocks(n, n_resamples, rng):
+        perm = np.abs(signs @ diffs) / n
+        hits += int(np.count_nonzero(perm >= observed - 1e-12 * max(observed, 1.0)))
+        total += len(signs)
+    p = hits / total if exact else (hits + 1) / (total + 1)
+    return diffs.mean(), p
+
+
+def bootstrap_ci(diffs, n_resamples=20000, alpha=0.05, seed=0):
+    """(low, high) percentile bootstrap CI of the mean of diffs."""
+    diffs = np.asarray(diffs, dtype=np.float64)
+    n = len(diffs)
+    if n == 0:
+        return np.nan, np.nan
+    rng = np.random.default_rng(seed)
+    means = np.empty(n_resamples)
+    for start in range(0, n_resamples, BLOCK):
+        stop = min(start + BLOCK, n_resamples)
+        means[start:stop] = diffs[rng.integers(0, n, size=(stop - start, n))].mean(axis=1)
+    low, high = np.percentile(means, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return low, high
@@ -0,0 +1,175 @@
+'''
+Single entry point for the eye-tracking scripts:
+    python nwb_eyetracking.py [--data DIR] [--pkl DIR] [--plots DIR] <command> [options]
+Options after the command are passed to it, e.g. `python nwb_eyetracking.py extract --jobs 4 --pickle`.
+-> extract      saccades/fixations split by Encoding/Recognition    (sac_fix.py)
+-> flag         phase split + blink-overlap artifact flags          (capture_all.py)
+-> blink-stats  blink counts and blink contamination                (blink_count.py, blink_removal.py)
+-> pipeline     every output from one pass per session              (pipeline.py)
+-> plots        per-patient metrics and figures                     (plots2.py)
+-> ttest        Encoding vs Recognition paired tests                (paired_t_test.py)
+-> sweep        blink margins x phase-window rules robustness table (sweep.py)
+-> detect       events re-detected from raw gaze (I-VT / I-DT)      (event_detect.py)
+-> align        peri-event spike rasters and PSTHs per unit         (spike_align.py)
+-> theta        LFP theta phase/power at fixation onsets            (theta_gaze_analysis/theta_phase.py)
+-> heatmap      gaze and fixation density maps per phase/outcome    (gaze_heatmap.py)
+-> features     per-trial gaze feature matrix (parquet/csv)         (trial_features.py)
+-> inspect      one session's behavior series and trials            (h5py only)
+-> check        trials/timestamp checks + phase-window index         (trial_checks.py, h5py only)
+Paths default to config.py; --data/--pkl/--plots override them for the command. Heavy modules
+(pynwb, pandas, scipy, matplotlib, seaborn) are only imported by the commands that use them, so
+inspect and check start in a fraction of a second.
+'''
+import os
+import sys
+import runpy
+import argparse
+
+# command -> scripts run in order as __main__
+SCRIPTS = {
+    'extract': ('sac_fix',),
+    'flag': ('capture_all',),
+    'blink-stats': ('blink_count', 'blink_removal'),
+    'pipeline': ('pipeline',),
+    'plots': ('plots2',),
+    'ttest': ('paired_t_test',),
+    'sweep': ('sweep',),
+    'detect': ('event_detect',),
+    'align': ('spike_align',),
+    'theta': ('theta_gaze_analysis.theta_phase',),
+    'heatmap': ('gaze_heatmap',),
+    'features': ('trial_features',),
+}
+COMMANDS = tuple(SCRIPTS) + ('inspect', 'check')
+
+
+def run_script(module, argv):
+    """Run module.py as if started from the command line with argv."""
+    sys.argv = [f"{module.replace('.', os.sep)}.py"] + list(argv)
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+
+
+def resolve_session(target, run_key):
+    """Session file from a path, a patient id (with run_key) or, if None, the first file found."""
+    import config
+    from sessions import find_sessions
+    if target is None:
+        paths = find_sessions(config.data_path)
+        if not paths:
+            raise SystemExit(f"No .nwb files under {config.data_path}")
+        return paths[0]
+    if os.path.exists(target):
+        return target
+    return config.session_path(target, run_key)
+
+
+def _preview(dataset, rows):
+    import numpy as np
+    return '\n'.join(f"    {np.array2string(np.asarray(row), max_line_width=200)}" for row in dataset[:rows])
+
+
+def cmd_inspect(argv):
+    parser = argparse.ArgumentParser(prog='nwb_eyetracking.py inspect',
+                                     description="Print one session's behavior series and trials table.")
+    parser.add_argument('session', nargs='?', help='.nwb path or patient id like sub-CS41 (default: first file)')
+    parser.add_argument('--run', choices=('R1', 'R2'), default='R1')
+    parser.add_argument('--rows', type=int, default=5, help='rows shown per dataset')
+    args = parser.parse_args(argv)
+
+    from nwb_session import open_nwb
+    path = resolve_session(args.session, args.run)
+    if not os.path.exists(path):
+        raise SystemExit(f"Path not found: {path}")
+    print(f"Session: {path}\n")
+    with open_nwb(path) as nwb:
+        beh = nwb.processing['behavior']
+        print("SECTION 1: BEHAVIOR METRICS")
+        for name in beh.data_interfaces:
+            if name == 'EyeTracking':
+                continue
+            ts = beh[name]['TimeSeries']
+            print(f"{name}: data {ts.data.shape} {ts.data.dtype}, unit {ts.unit}")
+            print(_preview(ts.data, args.rows))
+
+        print("\nSECTION 2: RAW EYE POSITIONS")
+        if 'EyeTracking' in beh.data_interfaces:
+            spatial = beh['EyeTracking'].spatial_series['SpatialSeries']
+            timing = f"rate {spatial.rate} Hz" if spatial.timestamps is None else f"{len(spatial.timestamps)} timestamps"
+            print(f"SpatialSeries: data {spatial.data.shape} {spatial.data.dtype}, unit {spatial.unit}, {timing}")
+            print(_preview(spatial.data, args.rows))
+        else:
+            print("No EyeTracking interface.")
+
+        print("\nSECTION 3: TRIALS")
+        table = nwb.intervals['trials']
+        columns = {col: table[col].data[:args.rows] for col in table.colnames}
+        n_trials = len(table['start_time'].data)
+        print(f"{n_trials} trials, columns: {', '.join(table.colnames)}")
+        print('    ' + ' | '.join(f"{col:>16}" for col in columns))
+        for i in range(min(args.rows, n_trials)):
+            cells = [v.decode() if isinstance(v, bytes) else v for v in (columns[col][i] for col in columns)]
+            print('    ' + ' | '.join(f"{str(c):>16}" for c in cells))
+
+
+def cmd_check(argv):
+    from sessions import find_sessions, session_key, run_sessions, add_jobs_argument
+    parser = argparse.ArgumentParser(prog='nwb_eyetracking.py check',
+                                     description='Check the trials table and event timestamps of every session and '
+                                                 'write the validated phase windows to pkl/phase_windows.json.')
+    parser.add_argument('--pid', help='only this patient (e.g. sub-CS41)')
+    parser.add_argument('--expect-reco', type=int, default=40, help='expected recognition trials (0 = any)')
+    parser.add_argument('--no-index', action='store_true', help='do not write the phase-window index')
+    add_jobs_argument(parser)
+    args = parser.parse_args(argv)
+
+    import config
+    from trial_checks import check_session
+    paths = [p for p in find_sessions(config.data_path) if args.pid is None or session_key(p)[0] == args.pid]
+    if not paths:
+        raise SystemExit(f"No .nwb files under {config.data_path}")
+
+    print(f"{'Session':<16} | {'Trials':>6} | {'Enc':>3} | {'Rec':>4} | {'Gap (s)':>8} | Status")
+    print("-" * 70)
+    n_bad = 0
+    checked = []
+    for path, result, error in run_sessions(check_session, paths, args.jobs, (args.expect_reco,)):
+        pid, run_key = session_key(path)
+        name = f"{pid} ({run_key})"
+        if error is not None:
+            n_bad += 1
+            print(f"{name:<16} | error: {error}")
+            continue
+        checked.append((path, result))
+        status = 'OK' if not result['problems'] else '; '.join(result['problems'])
+        n_bad += bool(result['problems'])
+        print(f"{name:<16} | {result['n_trials']:>6} | {result['n_encoding']:>3} | {result['n_recognition']:>4} | "
+              f"{result['gap']:>8.3f} | {status}")
+    print(f"\n{len(paths) - n_bad}/{len(paths)} sessions OK")
+    if not args.no_index and checked:
+        from phase_index import write_index
+        print(f"Phase windows index: {write_index(checked)}")
+    return 1 if n_bad else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', help='folder with sub-CS*/ .nwb files')
+    parser.add_argument('--pkl', help='folder for extracted events, caches and reports')
+    parser.add_argument('--plots', help='folder for figures and plot CSVs')
+    parser.add_argument('command', choices=COMMANDS)
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='options for the command')
+    args = parser.parse_args()
+
+    # config.py reads these when the command first imports it
+    for value, env in ((args.data, 'NWB_EYETRACKING_DATA'), (args.pkl, 'NWB_EYETRACKING_PKL'),
+                       (args.plots, 'NWB_EYETRACKING_PLOTS')):
+        if value:
+            os.environ[env] = os.path.abspath(value)
+
+    if args.command == 'inspect':
+        cmd_inspect(args.args)
+    elif args.command == 'check':
+        sys.exit(cmd_check(args.args))
+    else:
+        for module in SCRIPTS[args.command]:
+            run_script(module, args.args)
@@ -0,0 +1,83 @@
+'''
+Column-selective, chunked reads of NWB TimeSeries datasets.
+Instead of materialising ts.data[:] (every column, every row), read_columns() pulls only the
+requested columns with HDF5 hyperslab selections, chunk_rows rows at a time, into one
+preallocated array. A time window prunes rows first: timestamps are read (1 column) and
+searchsorted to the [lo, hi) row range, so rows outside the window are never read.
+Works on h5py datasets (lazy pynwb reads) and on plain NumPy arrays alike.
+'''
+import numpy as np
+import profiling
+
+DEFAULT_CHUNK_ROWS = 1 << 16
+
+
+def window_rows(timestamps, t_window):
+    """Row selection for timestamps inside [t0, t1]: a slice when timestamps are sorted, else a mask."""
+    n = len(timestamps)
+    if t_window is None:
+        return slice(0, n)
+    t0, t1 = t_window
+    if n < 2 or np.all(timestamps[1:] >= timestamps[:-1]):
+        lo = int(np.searchsorted(timestamps, t0, side='left'))
+        hi = int(np.searchsorted(timestamps, t1, side='right'))
+        return slice(lo, max(lo, hi))
+    return (timestamps >= t0) & (timestamps <= t1)
+
+
+def read_columns(dataset, columns, rows=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """(n_rows, len(columns)) float64 array of the given columns; rows is a slice or boolean mask.
+    1D datasets (e.g. Blink durations) are treated as a single column 0."""
+    n_total = dataset.shape[0]
+    if rows is None:
+        rows = slice(0, n_total)
+    columns = list(columns)
+    one_d = len(dataset.shape) == 1
+    if one_d and columns != [0]:
+        raise ValueError(f"1D dataset has only column 0, asked for {columns}")
+
+    if isinstance(rows, slice):
+        lo, hi, _ = rows.indices(n_total)
+        keep = None
+    else:
+        # Mask: read the bounding row range chunk by chunk and keep the masked rows
+        idx = np.flatnonzero(rows)
+        lo, hi = (int(idx[0]), int(idx[-1]) + 1) if len(idx) else (0, 0)
+        keep = rows
+
+    # h5py point/list selections need increasing indices; read sorted, reorder after
+    order = np.argsort(columns, kind='stable')
+    sorted_cols = [columns[i] for i in order]
+    unique_cols = sorted(set(sorted_cols))
+
+    n_out = hi - lo if keep is None else int(np.count_nonzero(keep[lo:hi]))
+    out = np.empty((n_out, len(unique_cols)), dtype=np.float64)
+    pos = 0
+    for start in range(lo, hi, chunk_rows):
+        stop = min(start + chunk_rows, hi)
+        if one_d:
+            block = np.asarray(dataset[start:stop], dtype=np.float64)[:, np.newaxis]
+        elif len(unique_cols) == 1:
+            block = np.asarray(dataset[start:stop, unique_cols[0]], dtype=np.float64)[:, np.newaxis]
+        else:
+            block = np.asarray(dataset[start:stop, unique_cols], dtype=np.float64)
+        if keep is not None:
+            block = block[keep[start:stop]]
+        out[pos:pos + len(block)] = block
+        pos += len(block)
+
+    # Map back to the requested column order (duplicates allowed)
+    itemsize = dataset.dtype.itemsize
+    profiling.add_bytes(getattr(dataset, 'name', None) or 'array', (hi - lo) * len(unique_cols) * itemsize)
+    col_pos = {c: i for i, c in enumerate(unique_cols)}
+    return out[:, [col_pos[c] for c in columns]]
+
+
+def read_timeseries(ts, columns, t_window=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """(timestamps, data) of a TimeSeries with data restricted to columns and to rows whose
+    timestamp lies in t_window (inclusive)."""
+    timestamps = np.asarray(ts.timestamps[:], dtype=np.float64)
+    profiling.add_bytes(getattr(ts.timestamps, 'name', None) or 'array', timestamps.size * ts.timestamps.dtype.itemsize)
+    rows = window_rows(timestamps, t_window)
+    data = read_columns(ts.data, columns, rows, chunk_rows)
+    return timestamps[rows], data
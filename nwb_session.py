@@ -0,0 +1,189 @@
+'''
+Fast session opener: maps the known NWB paths straight to h5py datasets instead of building the
+full pynwb object tree with io.read() (ecephys, units, electrodes ... which we never touch).
+open_nwb() yields an object with the small part of the pynwb API the scripts use:
+-> nwb.processing['behavior'].data_interfaces / ['Saccade'|'Fixation'|'Blink']['TimeSeries'].timestamps/.data
+-> nwb.processing['behavior']['EyeTracking'].spatial_series['SpatialSeries'] (.data, .timestamps or .rate)
+-> nwb.intervals['trials'][col].data and nwb.intervals['trials'].to_dataframe()
+Datasets stay lazy (h5py), so slicing reads only what is asked for. If the file does not have the
+expected layout, open_nwb() falls back to NWBHDF5IO(...).read().
+warm_session() reads the raw bytes of the behavior event and trials datasets with plain file reads
+(used by the session prefetcher, so the later h5py reads are served from the OS cache).
+'''
+import os
+import contextlib
+import h5py
+import numpy as np
+import profiling
+
+BEHAVIOR_PATH = 'processing/behavior'
+TRIALS_PATH = 'intervals/trials'
+EVENT_INTERFACES = ('Saccade', 'Fixation', 'Blink')
+WARM_BLOCK = 1 << 22
+
+
+class H5TimeSeries:
+    """TimeSeries/SpatialSeries group: data, timestamps (None if the series uses starting_time + rate)."""
+    def __init__(self, group):
+        self.name = group.name.split('/')[-1]
+        self.data = group['data']
+        self.timestamps = group['timestamps'] if 'timestamps' in group else None
+        self.starting_time = None
+        self.rate = None
+        if 'starting_time' in group:
+            self.starting_time = float(group['starting_time'][()])
+            self.rate = float(group['starting_time'].attrs['rate'])
+        self.unit = self.data.attrs.get('unit')
+
+
+class H5Interface:
+    """Container of series (BehavioralTimeSeries, EyeTracking): interface['TimeSeries'] etc."""
+    def __init__(self, group):
+        self.group = group
+
+    def __getitem__(self, name):
+        return H5TimeSeries(self.group[name])
+
+    def __contains__(self, name):
+        return name in self.group
+
+    def keys(self):
+        return [k for k in self.group.keys() if isinstance(self.group[k], h5py.Group)]
+
+    @property
+    def spatial_series(self):
+        return self
+
+
+class H5Module:
+    """Processing module (behavior): data_interfaces and module[name]."""
+    def __init__(self, group):
+        self.group = group
+        self.data_interfaces = {k: v for k, v in group.items() if isinstance(v, h5py.Group)}
+
+    def __getitem__(self, name):
+        return H5Interface(self.data_interfaces[name])
+
+    def keys(self):
+        return self.data_interfaces.keys()
+
+
+class H5Column:
+    def __init__(self, dataset):
+        self.data = dataset
+
+
+class H5Table:
+    """DynamicTable (trials): table[col].data and to_dataframe() for the non-ragged columns."""
+    def __init__(self, group):
+        self.group = group
+        ragged = {k[:-len('_index')] for k in group.keys() if k.endswith('_index')}
+        # Column order as written (the 'colnames' attribute), else HDF5 key order
+        names = [c.decode() if isinstance(c, bytes) else str(c) for c in group.attrs.get('colnames', group.keys())]
+        self.colnames = [k for k in names if k in group and k not in ragged
+                         and isinstance(group[k], h5py.Dataset) and group[k].ndim == 1]
+
+    def __getitem__(self, col):
+        return H5Column(self.group[col])
+
+    def column(self, col):
+        dset = self.group[col]
+        if h5py.check_string_dtype(dset.dtype) is not None:
+            return np.asarray(dset.asstr()[:], dtype=object)
+        return dset[:]
+
+    def to_dataframe(self):
+        import pandas as pd
+        index = pd.Index(self.group['id'][:], name='id')
+        return pd.DataFrame({col: self.column(col) for col in self.colnames}, index=index)
+
+
+class H5Session:
+    def __init__(self, f):
+        self.file = f
+        self.processing = {'behavior': H5Module(f[BEHAVIOR_PATH])}
+        self.intervals = {'trials': H5Table(f[TRIALS_PATH])}
+
+
+def has_expected_layout(f):
+    """True if behavior events and trials are where the fast path expects them."""
+    if BEHAVIOR_PATH not in f or TRIALS_PATH not in f:
+        return False
+    trials = f[TRIALS_PATH]
+    if not all(col in trials for col in ('id', 'start_time', 'stop_time')):
+        return False
+    beh = f[BEHAVIOR_PATH]
+    for name in EVENT_INTERFACES:
+        if name in beh:
+            ts = beh[name].get('TimeSeries')
+            if not isinstance(ts, h5py.Group) or 'data' not in ts or 'timestamps' not in ts:
+                return False
+    return True
+
+
+@contextlib.contextmanager
+def open_nwb(path, fast=True):
+    """Yield a read-only session: the h5py fast path when possible, else pynwb's io.read()."""
+    f = io = None
+    # One 'open' stage whichever path is taken
+    with profiling.stage('open'):
+        if fast:
+            f = h5py.File(path, 'r')
+            try:
+                fast_ok = has_expected_layout(f)
+            except Exception:
+                # Malformed or partially written layout: let pynwb read (or report) it
+                fast_ok = False
+            if not fast_ok:
+                f.close()
+                f = None
+        if f is None:
+            from pynwb import NWBHDF5IO
+            io = NWBHDF5IO(path, 'r')
+            try:
+                nwb = io.read()
+            except Exception:
+                io.close()
+                raise
+    try:
+        yield H5Session(f) if f is not None else nwb
+    finally:
+        (f if f is not None else io).close()
+
+
+def dataset_extents(dset):
+    """(offset, size) of the bytes of a contiguous or chunked dataset in its file ([] if not allocated)."""
+    if dset.chunks is None:
+        offset = dset.id.get_offset()
+        return [] if offset is None else [(offset, dset.id.get_storage_size())]
+    extents = []
+    for i in range(dset.id.get_num_chunks()):
+        info = dset.id.get_chunk_info(i)
+        extents.append((info.byte_offset, info.size))
+    return extents
+
+
+def warm_session(path, skip=('EyeTracking',)):
+    """Read the bytes of every dataset under the behavior (except skip) and trials groups, in file order."""
+    extents = []
+
+    def visit(name, obj):
+        if isinstance(obj, h5py.Dataset) and not any(part in skip for part in name.split('/')):
+            extents.extend(dataset_extents(obj))
+
+    with h5py.File(path, 'r') as f:
+        for group in (BEHAVIOR_PATH, TRIALS_PATH):
+            if group in f:
+                f[group].visititems(visit)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        for offset, size in sorted(extents):
+            while size > 0:
+                n = len(os.pread(fd, min(size, WARM_BLOCK), offset))
+                if n == 0:
+                    break
+                offset += n
+                size -= n
+    finally:
+        os.close(fd)
+    return sum(size for _, size in extents)
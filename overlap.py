@@ -0,0 +1,63 @@
+'''
+Sorted-interval overlap between gaze events and blinks (replaces the O(N*M) nested loops).
+Overlap uses the same strict rule as before: blink_start < event_end and blink_end > event_start.
+Blinks can be padded by pre/post margins (seconds) before the test: [start - pre, end + post].
+Intervals are sorted by start once; np.searchsorted finds the intervals that start before each
+event ends, and a running max of their ends tells whether any of them is still open at event start.
+'''
+import numpy as np
+import profiling
+
+
+def overlap_index(start, end, iv_start, iv_end):
+    """For each [start, end), index of an interval in iv_* that overlaps it, -1 if none.
+    If several overlap, the one with the latest end (among those starting before end) is returned."""
+    start = np.asarray(start, dtype=np.float64)
+    end = np.asarray(end, dtype=np.float64)
+    iv_start = np.asarray(iv_start, dtype=np.float64)
+    iv_end = np.asarray(iv_end, dtype=np.float64)
+    hit = np.full(len(start), -1, dtype=np.int64)
+
+    # NaN intervals/events never overlap (NaN comparisons are False in the old loops)
+    iv_keep = np.flatnonzero(~(np.isnan(iv_start) | np.isnan(iv_end)))
+    if len(iv_keep) == 0 or len(start) == 0:
+        return hit
+    order = iv_keep[np.argsort(iv_start[iv_keep], kind='stable')]
+    s_sorted = iv_start[order]
+    e_sorted = iv_end[order]
+
+    # running max of interval ends and the position that holds it
+    run_max = np.maximum.accumulate(e_sorted)
+    pos = np.arange(len(e_sorted))
+    run_arg = np.maximum.accumulate(np.where(e_sorted == run_max, pos, 0))
+
+    valid = ~(np.isnan(start) | np.isnan(end))
+    # number of intervals with iv_start < end
+    k = np.searchsorted(s_sorted, end, side='left')
+    cand = valid & (k > 0)
+    last = np.where(cand, k - 1, 0)
+    is_hit = cand & (run_max[last] > start)
+    hit[is_hit] = order[run_arg[last[is_hit]]]
+    return hit
+
+
+def blink_overlaps(ev_start, ev_end, bl_start, bl_end, pre=0.0, post=0.0):
+    """(event_blink, blink_event): per event the index of an overlapping blink, per blink the index
+    of an event it contaminates; -1 where there is none. pre/post pad every blink."""
+    with profiling.stage('overlap'):
+        bl_start = np.asarray(bl_start, dtype=np.float64) - pre
+        bl_end = np.asarray(bl_end, dtype=np.float64) + post
+        event_blink = overlap_index(ev_start, ev_end, bl_start, bl_end)
+        blink_event = overlap_index(bl_start, bl_end, ev_start, ev_end)
+    return event_blink, blink_event
+
+
+def flag_artifacts(events, blinks, pre=0.0, post=0.0):
+    """Set events['is_artifact'] (columnar event set) where an event overlaps a blink; returns the
+    per-event blink index."""
+    with profiling.stage('overlap'):
+        event_blink = overlap_index(events['start'], events['end'],
+                                    np.asarray(blinks['start']) - pre, np.asarray(blinks['end']) + post)
+        events['is_artifact'] = event_blink >= 0
+    profiling.count('artifacts', np.count_nonzero(events['is_artifact']))
+    return event_blink
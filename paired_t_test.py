@@ -1,65 +1,78 @@
-''' 
-This script performs a paired t-test on fixation durations to compare 
+'''
+This script performs a paired t-test on fixation durations to compare
 Encoding and Recognition sessions across all patients.
 
-We use a paired t-test because we are comparing the same subjects under 
-two different conditions. The analysis calculates the mean duration for 
-each task per patient and finds the individual differences. 
+We use a paired t-test because we are comparing the same subjects under
+two different conditions. The analysis calculates the mean duration for
+each task per patient and finds the individual differences.
 
-By comparing the average of these differences against the variation (noise), 
-the test maps the result onto a T-distribution curve. The P-value represents 
-the area under this curve. '''
+By comparing the average of these differences against the variation (noise),
+the test maps the result onto a T-distribution curve. The P-value represents
+the area under this curve.
 
-import pickle
-import numpy as np
+With only ~12 patients the t-distribution assumption is fragile, so the same differences are also
+tested with a sign-flip permutation test and a bootstrap CI of the mean difference (group_stats.py).
+Any metric can be used (--metric fixation_duration, pupil, saccade_duration, saccade_amplitude,
+saccade_velocity), per patient mean or median (--stat), and --exclude-artifacts drops blink-overlap
+events (needs the flagged_eye_events output of capture_all.py, passed with --path). '''
+
+import os
+import argparse
+import config
 import pandas as pd
 from scipy import stats
+from event_store import load_any, event_columns
+from group_stats import METRICS, metric_columns, paired_means, sign_flip_test, bootstrap_ci
 
 
-pkl_path = r'e:\eyetracking\pkl\isolated_eye_events.pkl'
-
+# Event store written by sac_fix.py (isolated_eye_events.npz or an old isolated_eye_events.pkl also work)
+pkl_path = os.path.join(config.pkl_folder, 'isolated_eye_events')
 
-def run_fixation_stats(path):
-    with open(path, 'rb') as f:
-        master_dict = pickle.load(f)
 
-    patient_results = []
+def run_fixation_stats(path, metric='fixation_duration', stat='mean', exclude_artifacts=False,
+                       n_resamples=20000, seed=0):
+    # Only the columns the metric needs are read from a store
+    master_dict = load_any(path, columns=metric_columns(metric, exclude_artifacts))
+    patients, enc, rec = paired_means(master_dict, metric, exclude_artifacts, stat)
 
-    for pid, runs in master_dict.items():
-        enc_durations = []
-        rec_durations = []
-        for run_key in ['R1', 'R2']:
-            if run_key not in runs:
-                continue
-            sessions = runs[run_key]
-            for e in sessions.get('Encoding', []):
-                if e.get('type') == 'Fixation':
-                    enc_durations.append(e['duration'])
-            for e in sessions.get('Recognition', []):
-                if e.get('type') == 'Fixation':
-                    rec_durations.append(e['duration'])
+    df = pd.DataFrame({'Patient': patients, 'Encoding_Mean': enc, 'Recognition_Mean': rec})
+    unit = 's' if METRICS[metric][1] == 'duration' else ''
 
-        if enc_durations and rec_durations:
-            patient_results.append({
-                'Patient': pid,
-                'Encoding_Mean': np.mean(enc_durations),
-                'Recognition_Mean': np.mean(rec_durations)
-            })
-
-    df = pd.DataFrame(patient_results)
-    
     # Running the Paired T-Test
     # This compares each patient to themselves
     t_stat, p_val = stats.ttest_rel(df['Encoding_Mean'], df['Recognition_Mean'])
 
     print(f"Paired T-Test Results (n={len(df)})")
-    print(f"Enc Mean: {df['Encoding_Mean'].mean():.4f}s")
-    print(f"Rec Mean: {df['Recognition_Mean'].mean():.4f}s")
-   
+    print(f"Enc Mean: {df['Encoding_Mean'].mean():.4f}{unit}")
+    print(f"Rec Mean: {df['Recognition_Mean'].mean():.4f}{unit}")
+
     print(f"T-statistic: {t_stat:.4f}")
     print(f"P-value: {p_val:.4f}")
 
+    # Distribution-free checks on the same per-patient differences
+    diffs = enc - rec
+    mean_diff, perm_p = sign_flip_test(diffs, n_resamples, seed)
+    low, high = bootstrap_ci(diffs, n_resamples, seed=seed)
+    print(f"\nMean difference (Enc - Rec): {mean_diff:.4f}")
+    print(f"Sign-flip permutation P-value: {perm_p:.4f}")
+    print(f"Bootstrap 95% CI: [{low:.4f}, {high:.4f}]")
+
     return df
 
-# Execute
-stats_df = run_fixation_stats(pkl_path)
\ No newline at end of file
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Paired Encoding vs Recognition tests per patient.')
+    parser.add_argument('--path', default=pkl_path, help='event store, records .npz or legacy .pkl')
+    parser.add_argument('--metric', choices=sorted(METRICS), default='fixation_duration')
+    parser.add_argument('--stat', choices=('mean', 'median'), default='mean', help='per patient summary')
+    parser.add_argument('--exclude-artifacts', action='store_true', help='drop events flagged is_artifact')
+    parser.add_argument('--resamples', type=int, default=20000, help='permutations / bootstrap resamples')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.exclude_artifacts and 'is_artifact' not in event_columns(args.path):
+        parser.error(f"{args.path} has no is_artifact column (use the flagged events)")
+
+    print(f"Metric: {args.metric} (per patient {args.stat}){' excluding artifacts' if args.exclude_artifacts else ''}")
+    # Execute
+    stats_df = run_fixation_stats(args.path, args.metric, args.stat, args.exclude_artifacts, args.resamples,
+                                  args.seed)
@@ -0,0 +1,61 @@
+'''
+Index of validated Encoding/Recognition windows, pkl/phase_windows.json, written by
+`nwb_eyetracking.py check` (trial_checks.py). One entry per session file:
+    {"<file name>": {"pid", "run", "ok", "enco_window": [start, stop], "reco_window": [start, stop],
+                     "size", "mtime_ns"}}
+get_encoding_recognition_windows(nwb, full_path) takes the windows from here when the session passed
+every check and its file is unchanged (same size and mtime), instead of reading the trials table again.
+'''
+import os
+import json
+import config
+
+INDEX_NAME = 'phase_windows.json'
+_loaded = {}
+
+
+def index_path():
+    return os.path.join(config.pkl_folder, INDEX_NAME)
+
+
+def _stat(full_path):
+    st = os.stat(full_path)
+    return st.st_size, st.st_mtime_ns
+
+
+def write_index(results, path=None):
+    """Write check_session() results (with windows) to the index, replacing entries for the same files."""
+    path = path or index_path()
+    entries = load_index(path)
+    for full_path, result in results:
+        size, mtime_ns = _stat(full_path)
+        entries[os.path.basename(full_path)] = {
+            'pid': result['pid'], 'run': result['run'], 'ok': not result['problems'],
+            'enco_window': result['enco_window'], 'reco_window': result['reco_window'],
+            'size': size, 'mtime_ns': mtime_ns}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(entries, f, indent=1, sort_keys=True)
+    _loaded.pop(path, None)
+    return path
+
+
+def load_index(path=None):
+    path = path or index_path()
+    if not os.path.exists(path):
+        return {}
+    mtime = os.stat(path).st_mtime_ns
+    if path not in _loaded or _loaded[path][0] != mtime:
+        with open(path) as f:
+            _loaded[path] = (mtime, json.load(f))
+    return _loaded[path][1]
+
+
+def indexed_windows(full_path, path=None):
+    """(enco_window, reco_window) from the index, or None if the session is missing, failed or changed."""
+    entry = load_index(path).get(os.path.basename(full_path))
+    if not entry or not entry['ok'] or entry['enco_window'] is None:
+        return None
+    if (entry['size'], entry['mtime_ns']) != _stat(full_path):
+        return None
+    return tuple(entry['enco_window']), tuple(entry['reco_window'])
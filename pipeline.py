@@ -0,0 +1,278 @@
+'''
+Single-pass session pipeline: each NWB file is opened once, its behavior arrays and trials are read
+once, and every registered stage computes its per-session output from those arrays. The standalone
+scripts (blink_count, blink_removal, sac_fix, capture_all, plots2) call the same per-session
+functions defined here, so both routes give the same numbers.
+Stages (--stages, default all):
+-> blink_counts       blinks fully inside encoding/recognition      pkl/blink_counts.csv
+-> contamination      isolated vs contaminating blinks               pkl/blink_contamination.csv
+-> phase_split        saccades/fixations split by phase (sac_fix)    pkl/isolated_eye_events/
+-> artifact_flags     phase split + blink artifacts (capture_all)    pkl/flagged_eye_events/
+-> patient_summary    per patient/phase means (plots2)               plots/Patient_Behavior_Audit.csv
+-> trial_correctness  per recognition trial stats + response_correct plots/Trial_Correctness.csv
+New stages are added with register_stage(name, compute, write).
+'''
+import os
+import config
+import csv
+import argparse
+import numpy as np
+import profiling
+from nwb_session import open_nwb
+from eye_events import (EVENT_COLUMNS, empty_events, get_event_arrays, get_encoding_recognition_windows,
+                        concat_events, sort_by_start, phase_masks, split_by_phase)
+from overlap import flag_artifacts, blink_overlaps
+from trial_stats import trial_summary
+from sessions import find_sessions, session_key, add_jobs_argument, add_prefetch_argument
+from extract_cache import SessionCache, run_cached, add_cache_arguments
+from event_store import write_store
+from profiling import BatchProfiler, add_profile_argument
+
+data_path = config.data_path
+output_folder = config.pkl_folder
+plot_folder = config.plot_folder
+
+IGNORE_PATIENTS = ('sub-CS53',)  # calibration issues, see README
+
+
+def load_session(full_path):
+    """Everything the stages need from one file, read in a single open."""
+    pid, run_key = session_key(full_path)
+    with open_nwb(full_path) as nwb:
+        beh = nwb.processing['behavior']
+        enco_window, reco_window = get_encoding_recognition_windows(nwb, full_path)
+        blinks = get_event_arrays(beh, 'Blink')
+        saccades = get_event_arrays(beh, 'Saccade')
+        fixations = get_event_arrays(beh, 'Fixation')
+        table = nwb.intervals['trials']
+        starts = np.asarray(table['start_time'].data[:], dtype=np.float64)
+        stops = np.asarray(table['stop_time'].data[:], dtype=np.float64)
+        if 'response_correct' in table.colnames:
+            correct = np.asarray(table['response_correct'].data[:], dtype=np.float64)
+        else:
+            correct = np.full(len(starts), np.nan)
+    order = np.argsort(starts, kind='stable')
+    trials = {'start_time': starts[order], 'stop_time': stops[order], 'response_correct': correct[order]}
+    return {'path': full_path, 'pid': pid, 'run': run_key, 'enco_window': enco_window, 'reco_window': reco_window,
+            'blinks': blinks, 'saccades': saccades, 'fixations': fixations, 'trials': trials}
+
+
+# Per-session computations (shared with the standalone scripts)
+
+def phase_blink_counts(blinks, enco_window, reco_window):
+    """(encoding_count, recognition_count) of blinks fully inside each phase."""
+    in_enco, in_reco = phase_masks(blinks, enco_window, reco_window)
+    return int(in_enco.sum()), int(in_reco.sum())
+
+
+def blink_contamination(blinks, saccades, fixations):
+    """(isolated_blinks, contamination_blinks, contaminated_event_count): blink index arrays and event count.
+    A blink contaminates if it overlaps any saccade/fixation; an event is contaminated if any blink overlaps it."""
+    movements = concat_events(saccades, fixations)
+    event_blink, blink_event = blink_overlaps(movements['start'], movements['end'], blinks['start'], blinks['end'])
+    is_contaminator = blink_event >= 0
+    return np.flatnonzero(~is_contaminator), np.flatnonzero(is_contaminator), int(np.count_nonzero(event_blink >= 0))
+
+
+def phase_timeline(saccades, fixations, enco_window, reco_window):
+    """(encoding_events, recognition_events): saccades + fixations sorted by start, fully inside each phase."""
+    timeline = sort_by_start(concat_events(saccades, fixations))
+    return split_by_phase(timeline, enco_window, reco_window)
+
+
+def flagged_timeline(blinks, saccades, fixations, enco_window, reco_window):
+    """phase_timeline() with is_artifact set for events overlapping a blink."""
+    saccades, fixations = dict(saccades), dict(fixations)
+    flag_artifacts(saccades, blinks)
+    flag_artifacts(fixations, blinks)
+    return phase_timeline(saccades, fixations, enco_window, reco_window)
+
+
+def phase_summary_rows(pid, saccades, fixations, enco_window, reco_window):
+    """Per-phase mean fixation duration, pupil, saccade duration/amplitude/velocity (plots2 audit rows)."""
+    def mean(events, mask, col):
+        return np.mean(events[col][mask]) if mask.any() else np.nan
+
+    rows = []
+    fix_masks = phase_masks(fixations, enco_window, reco_window)
+    sac_masks = phase_masks(saccades, enco_window, reco_window)
+    for view, fix_m, sac_m in zip(('Encoding', 'Recognition'), fix_masks, sac_masks):
+        if fix_m.any() or sac_m.any():
+            rows.append({
+                'Patient': pid,
+                'View': view,
+                'Fixation_Dur': mean(fixations, fix_m, 'duration'),
+                'Avg_Pupil': mean(fixations, fix_m, 'pupil_size'),
+                'Saccade_Dur': mean(saccades, sac_m, 'duration'),
+                'Saccade_Amp': mean(saccades, sac_m, 'amplitude'),
+                'Saccade_Velo': mean(saccades, sac_m, 'velocity'),
+            })
+    return rows
+
+
+def recognition_trial_table(trials, fixations, saccades=None, rule='start'):
+    """trial_summary() for the recognition trials (row 0 of the time-sorted trials is encoding)."""
+    reco = {col: arr[1:] for col, arr in trials.items()}
+    return trial_summary(reco['start_time'], reco['stop_time'], fixations=fixations, saccades=saccades,
+                         response_correct=reco['response_correct'], rule=rule)
+
+
+def trial_outcome_rows(pid, per_trial):
+    """Correct/Incorrect mean fixation duration rows for trials with a response and at least one fixation."""
+    rows = []
+    for acc, n_fix, fix_mean in zip(per_trial['response_correct'], per_trial['n_fixations'], per_trial['fix_dur_mean']):
+        if np.isnan(acc) or n_fix == 0:
+            continue
+        # Label by result: 1 is Correct, 0 is Incorrect
+        rows.append({'Patient': pid, 'Result': 'Correct' if acc == 1 else 'Incorrect', 'Fix_Duration_Sec': fix_mean})
+    return rows
+
+
+# Stage registry: name -> (compute(session) -> per-session result, write(results, out_dirs))
+STAGES = {}
+
+
+def register_stage(name, compute, write):
+    STAGES[name] = (compute, write)
+
+
+def write_csv(path, rows, fields):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"  wrote {path}")
+
+
+def _write_blink_counts(results, out):
+    rows = [{'pid': pid, 'run': run, 'encoding': enc, 'recognition': rec} for pid, run, (enc, rec) in results]
+    write_csv(os.path.join(out['pkl'], 'blink_counts.csv'), rows, ['pid', 'run', 'encoding', 'recognition'])
+
+
+def _write_contamination(results, out):
+    rows = [{'pid': pid, 'run': run, 'isolated_blinks': len(iso), 'contamination_blinks': len(cont),
+             'contaminated_events': n_ev} for pid, run, (iso, cont, n_ev) in results]
+    write_csv(os.path.join(out['pkl'], 'blink_contamination.csv'), rows,
+              ['pid', 'run', 'isolated_blinks', 'contamination_blinks', 'contaminated_events'])
+
+
+def _write_phase_split(results, out):
+    nested = {}
+    for pid, run, (enc, rec) in results:
+        if pid not in nested:
+            nested[pid] = {r: {'Encoding': empty_events(), 'Recognition': empty_events()} for r in ('R1', 'R2')}
+        nested[pid][run]['Encoding'] = concat_events(nested[pid][run]['Encoding'], enc)
+        nested[pid][run]['Recognition'] = concat_events(nested[pid][run]['Recognition'], rec)
+    path = os.path.join(out['pkl'], 'isolated_eye_events')
+    write_store(path, nested, [col for col in EVENT_COLUMNS if col != 'is_artifact'])
+    print(f"  wrote {path}")
+
+
+def _write_artifact_flags(results, out):
+    nested = {}
+    for pid, run, (enc, rec) in results:
+        nested.setdefault(pid, {})[run] = {'Encoding': enc, 'Recognition': rec}
+    path = os.path.join(out['pkl'], 'flagged_eye_events')
+    write_store(path, nested)
+    print(f"  wrote {path}")
+
+
+def _write_patient_summary(results, out):
+    rows = [row for pid, run, session_rows in results if pid not in IGNORE_PATIENTS for row in session_rows]
+    write_csv(os.path.join(out['plots'], 'Patient_Behavior_Audit.csv'), rows,
+              ['Patient', 'View', 'Fixation_Dur', 'Avg_Pupil', 'Saccade_Dur', 'Saccade_Amp', 'Saccade_Velo'])
+
+
+def _write_trial_correctness(results, out):
+    rows = []
+    for pid, run, per_trial in results:
+        if pid in IGNORE_PATIENTS:
+            continue
+        for i in range(len(per_trial['trial'])):
+            rows.append(dict({'pid': pid, 'run': run}, **{k: v[i].item() for k, v in per_trial.items()}))
+    fields = ['pid', 'run'] + (list(results[0][2].keys()) if results else [])
+    write_csv(os.path.join(out['plots'], 'Trial_Correctness.csv'), rows, fields)
+
+
+register_stage('blink_counts',
+               lambda s: phase_blink_counts(s['blinks'], s['enco_window'], s['reco_window']), _write_blink_counts)
+register_stage('contamination',
+               lambda s: blink_contamination(s['blinks'], s['saccades'], s['fixations']), _write_contamination)
+register_stage('phase_split',
+               lambda s: phase_timeline(s['saccades'], s['fixations'], s['enco_window'], s['reco_window']),
+               _write_phase_split)
+register_stage('artifact_flags',
+               lambda s: flagged_timeline(s['blinks'], s['saccades'], s['fixations'], s['enco_window'], s['reco_window']),
+               _write_artifact_flags)
+register_stage('patient_summary',
+               lambda s: phase_summary_rows(s['pid'], s['saccades'], s['fixations'], s['enco_window'], s['reco_window']),
+               _write_patient_summary)
+register_stage('trial_correctness',
+               lambda s: recognition_trial_table(s['trials'], s['fixations'], s['saccades']), _write_trial_correctness)
+
+
+def run_stages(full_path, stage_names):
+    """Worker: load the session once and run every requested stage on it."""
+    return session_stages(load_session(full_path), stage_names)
+
+
+def session_stages(session, stage_names):
+    """Every requested stage on an already loaded session."""
+    results = {}
+    for name in stage_names:
+        with profiling.stage(f'stage:{name}'):
+            results[name] = STAGES[name][0](session)
+    return results
+
+
+def parse_stages(value):
+    names = list(STAGES) if value == 'all' else [v.strip() for v in value.split(',') if v.strip()]
+    unknown = [n for n in names if n not in STAGES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown stage(s) {unknown}; choose from {list(STAGES)}")
+    return names
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Open each session once and write every stage output.')
+    parser.add_argument('--stages', type=parse_stages, default=list(STAGES),
+                        help=f"comma-separated subset of {', '.join(STAGES)} (default all)")
+    parser.add_argument('--data', default=data_path, help='folder with sub-CS*/ .nwb files')
+    add_jobs_argument(parser)
+    add_cache_arguments(parser)
+    add_profile_argument(parser)
+    add_prefetch_argument(parser)
+    args = parser.parse_args()
+
+    out = {'pkl': output_folder, 'plots': plot_folder}
+    cache = SessionCache(os.path.join(output_folder, 'cache', 'pipeline'),
+                         {'worker': 'pipeline.run_stages', 'stages': sorted(args.stages)},
+                         content_hash=args.hash, enabled=not (args.no_cache or args.profile))
+    profiler = BatchProfiler(args.profile)
+    per_stage = {name: [] for name in args.stages}
+    print(f"Running stages: {', '.join(args.stages)}\n")
+    # Profiles need the reads inside the worker, so --profile loads in-process without prefetching
+    if args.profile:
+        worker, load = profiler.wrap(run_stages), None
+    else:
+        worker, load = session_stages, load_session
+    for full_path, result, error in run_cached(worker, find_sessions(args.data), cache, args.jobs, (args.stages,),
+                                               load, args.prefetch):
+        pid, run_key = session_key(full_path)
+        if error is not None:
+            print(f"Error in {os.path.basename(full_path)}: {error}")
+            continue
+        result = profiler.collect(full_path, result)
+        for name in args.stages:
+            per_stage[name].append((pid, run_key, result[name]))
+        print(f"{pid} ({run_key}) done")
+
+    print("\nWriting outputs:")
+    for name in args.stages:
+        with profiler.stage(f'write:{name}'):
+            STAGES[name][1](per_stage[name], out)
+    print(cache.summary())
+    if args.profile:
+        print(f"Profile saved to: {profiler.write(output_folder, 'pipeline')}")
+        print(profiler.summary())
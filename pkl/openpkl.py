@@ -1,20 +1,32 @@
 '''
-Opens the pickle file and prints a preview plus summary per patient and run (R1 / R2).
+Opens the flagged eye events and prints a preview plus summary per patient and run (R1 / R2).
+Reads the event store pkl/flagged_eye_events/ through EventStore.query (only the previewed rows
+and the start column for the counts are touched); falls back to flagged_eye_events.pkl.
 '''
-import pickle
 import os
+import sys
 
-pkl_folder = r'e:\eyetracking\pkl'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from eye_events import events_to_dicts
+from event_store import is_store, EventStore
+
+pkl_folder = config.pkl_folder
+store_path = os.path.join(pkl_folder, 'flagged_eye_events')
 pkl_path = os.path.join(pkl_folder, 'flagged_eye_events.pkl')
 
-with open(pkl_path, 'rb') as f:
-    master_dict = pickle.load(f)
+events_store = EventStore(store_path if is_store(store_path) else pkl_path)
 
-# Preview: first 5 events (type = Saccade/Fixation as in NWB dataset; flagged pkl also has is_artifact)
+# Preview: first 5 events (type = Saccade/Fixation as in NWB dataset; flagged events also have is_artifact)
 preview_pid = 'sub-CS41'
 preview_run = 'R1'
-if preview_pid in master_dict and preview_run in master_dict[preview_pid]:
-    preview = master_dict[preview_pid][preview_run]['Encoding'][:5]
+preview = None
+sliced = events_store.query(preview_pid, preview_run, 'Encoding', frame=False)
+if sliced:
+    events = sliced[preview_pid][preview_run]['Encoding']
+    preview = events_to_dicts({col: arr[:5] for col, arr in events.items()}, with_artifact='is_artifact' in events)
+
+if preview is not None:
     print(f"Preview: {preview_pid} {preview_run} Encoding (first 5 events):")
     for event in preview:
         t = event['type']
@@ -30,12 +42,13 @@ else:
     print(f"Preview: {preview_pid} / {preview_run} not in pickle.")
 
 # Summary: per patient, per run
+master_dict = events_store.query(columns=['start'], frame=False)
 print("\nSummary")
 for pid in sorted(master_dict.keys()):
     runs = master_dict[pid]
     for run in ['R1', 'R2']:
         if run not in runs:
             continue
-        enc_count = len(runs[run]['Encoding'])
-        rec_count = len(runs[run]['Recognition'])
+        enc_count = len(runs[run]['Encoding']['start']) if 'Encoding' in runs[run] else 0
+        rec_count = len(runs[run]['Recognition']['start']) if 'Recognition' in runs[run] else 0
         print(f"{pid} ({run}): Encoding={enc_count}, Recognition={rec_count}")
@@ -0,0 +1,116 @@
+'''
+Figure rendering for plots2.py, split from the data processing. Every figure is drawn from a CSV in
+the plot folder:
+-> Patient_Behavior_Audit.csv            Plot_<metric>.png (Encoding vs Recognition per patient, 5 metrics)
+-> Fixation_Correct_vs_Incorrect.csv     Plot_Fixation_Correct_vs_Incorrect.png
+Figures are rendered with the non-interactive Agg backend in a process pool (--jobs). Each figure's
+input hash (the columns it plots + its settings) is kept in .render_hashes.json next to the images;
+a figure whose hash matches the previous render and whose image still exists is skipped (--force redraws).
+Run directly to re-render from the existing CSVs without reprocessing the NWB files.
+'''
+import os
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import config
+from sessions import add_jobs_argument
+
+AUDIT_CSV = 'Patient_Behavior_Audit.csv'
+OUTCOME_CSV = 'Fixation_Correct_vs_Incorrect.csv'
+HASH_FILE = '.render_hashes.json'
+# Bump when the drawing code changes so every figure is redrawn once
+RENDER_VERSION = 1
+
+# (image name, source csv, y column, hue column, y label, legend title)
+FIGURES = [(f"Plot_{col}.png", AUDIT_CSV, col, 'View', label, 'Session') for col, label in (
+    ('Fixation_Dur', 'Fixation Duration (s)'), ('Avg_Pupil', 'Pupil Size'), ('Saccade_Dur', 'Saccade Duration (s)'),
+    ('Saccade_Amp', 'Saccade Amplitude'), ('Saccade_Velo', 'Saccade Velocity'))]
+FIGURES.append(('Plot_Fixation_Correct_vs_Incorrect.png', OUTCOME_CSV, 'Fix_Duration_Sec', 'Result',
+                'Avg Fixation Duration (s)', 'Trial Result'))
+
+
+def render_figure(df, out_path, y, hue, ylabel, legend_title):
+    """Worker: one bar plot of y per patient split by hue, saved to out_path."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # Width grows with the cohort so patient labels stay readable
+    n_patients = df['Patient'].nunique()
+    plt.figure(figsize=(max(10, 0.8 * n_patients), 6))
+    sns.barplot(data=df, x='Patient', y=y, hue=hue, palette='muted')
+    plt.xlabel('Patient ID', labelpad=15)
+    plt.ylabel(ylabel)
+    plt.xticks(rotation=0)
+    plt.legend(title=legend_title, loc='upper right')
+    plt.tight_layout()
+    plt.savefig(out_path)
+    plt.close()
+    return out_path
+
+
+def figure_hash(df, figure):
+    name, _, y, hue, ylabel, legend_title = figure
+    h = hashlib.sha256(json.dumps([RENDER_VERSION, name, y, hue, ylabel, legend_title]).encode())
+    h.update(df[['Patient', hue, y]].to_csv(index=False).encode())
+    return h.hexdigest()
+
+
+def render_plots(plot_folder, jobs=1, force=False):
+    """Render every figure whose CSV exists and whose input changed; returns (rendered, skipped) names."""
+    import pandas as pd
+    hash_path = os.path.join(plot_folder, HASH_FILE)
+    hashes = {}
+    if os.path.exists(hash_path) and not force:
+        with open(hash_path) as f:
+            hashes = json.load(f)
+
+    frames = {}
+    todo, skipped = [], []
+    for figure in FIGURES:
+        name, csv_name = figure[0], figure[1]
+        csv_path = os.path.join(plot_folder, csv_name)
+        if not os.path.exists(csv_path):
+            continue
+        if csv_name not in frames:
+            frames[csv_name] = pd.read_csv(csv_path)
+        df = frames[csv_name]
+        if df.empty:
+            continue
+        digest = figure_hash(df, figure)
+        if hashes.get(name) == digest and os.path.exists(os.path.join(plot_folder, name)):
+            skipped.append(name)
+        else:
+            todo.append((figure, df, digest))
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    rendered = []
+    if todo:
+        args = [(df, os.path.join(plot_folder, fig[0]), fig[2], fig[3], fig[4], fig[5]) for fig, df, _ in todo]
+        if jobs <= 1 or len(todo) == 1:
+            for a in args:
+                render_figure(*a)
+        else:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(todo))) as pool:
+                for fut in [pool.submit(render_figure, *a) for a in args]:
+                    fut.result()
+        for figure, _, digest in todo:
+            hashes[figure[0]] = digest
+            rendered.append(figure[0])
+        with open(hash_path, 'w') as f:
+            json.dump(hashes, f, indent=1, sort_keys=True)
+    return rendered, skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render the plots2.py figures from the CSVs in the plot folder.')
+    add_jobs_argument(parser)
+    parser.add_argument('--force', action='store_true', help='redraw every figure')
+    parser.add_argument('--plots', default=config.plot_folder, help='plot folder with the CSVs')
+    args = parser.parse_args()
+
+    rendered, skipped = render_plots(args.plots, args.jobs, args.force)
+    print(f"Rendered {len(rendered)} figures, {len(skipped)} unchanged (skipped) in {args.plots}")
@@ -0,0 +1,237 @@
+'''
+Optional timing and memory instrumentation for the extraction scripts (--profile).
+Library code marks its steps with stage('name') and reports bytes read per HDF5 dataset and event
+counts; all of these are no-ops unless a profile is active in the current process, so the cost
+when profiling is off is one global lookup per call.
+-> stage('open' | 'read:Saccade' | 'overlap' | 'split' | 'write' ...)  wall time, calls, tracemalloc peak
+-> add_bytes(dataset_name, n)                                          bytes read per dataset
+-> count(name, n)                                                      event counts
+BatchProfiler wraps the per-session worker so every session is recorded in its worker process and
+sent back with the result; main-process steps (writing stores/pickles) go into a '(batch)' record.
+write() saves <out>/profile/<name>_profile.json (everything) and <name>_profile.csv (one row each).
+'''
+import os
+import sys
+import csv
+import json
+import time
+import tracemalloc
+from contextlib import nullcontext
+from sessions import session_key
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+# SessionProfile being recorded in this process, None when profiling is off
+_active = None
+_NO_STAGE = nullcontext()
+
+
+def stage(name):
+    """Context manager timing one step of the active profile (a shared no-op when off)."""
+    if _active is None:
+        return _NO_STAGE
+    return _active.stage(name)
+
+
+def add_bytes(dataset, n):
+    if _active is not None:
+        _active.bytes_read[dataset] = _active.bytes_read.get(dataset, 0) + int(n)
+
+
+def count(name, n):
+    if _active is not None:
+        _active.counts[name] = _active.counts.get(name, 0) + int(n)
+
+
+def rss_peak_mb():
+    """Process high-water RSS in MB (None where the resource module is missing)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+class _Stage:
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if self.profile._stack:
+            # keep the parent's peak so far: reset_peak() below starts the count again for this stage
+            parent = self.profile._stack[-1]
+            parent[3] = max(parent[3], peak)
+        tracemalloc.reset_peak()
+        # [name, start time, traced bytes at entry, highest peak seen in nested stages]
+        self.profile._stack.append([self.name, time.perf_counter(), current, current])
+        return self
+
+    def __exit__(self, *exc):
+        name, t0, base, nested_peak = self.profile._stack.pop()
+        elapsed = time.perf_counter() - t0
+        peak = max(tracemalloc.get_traced_memory()[1], nested_peak)
+        rec = self.profile.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peak_mb': 0.0})
+        rec['calls'] += 1
+        rec['seconds'] += elapsed
+        rec['peak_mb'] = max(rec['peak_mb'], (peak - base) / 2**20)
+        if self.profile._stack:
+            parent = self.profile._stack[-1]
+            parent[3] = max(parent[3], peak)
+        return False
+
+
+class SessionProfile:
+    """Stages, bytes read and counts recorded for one session (or the batch)."""
+    def __init__(self, label):
+        self.label = label
+        self.stages = {}
+        self.bytes_read = {}
+        self.counts = {}
+        self.total_seconds = 0.0
+        self.peak_mb = 0.0
+        self.rss_peak_mb = None
+        self._stack = []
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        self._root = self.stage('(session)')
+        self._root.__enter__()
+        _active = self
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        self._root.__exit__(*exc)
+        root = self.stages.pop('(session)')
+        self.total_seconds, self.peak_mb = root['seconds'], root['peak_mb']
+        self.rss_peak_mb = rss_peak_mb()
+        if self._started_tracing:
+            tracemalloc.stop()
+        _active = self._previous
+        return False
+
+    def to_dict(self):
+        return {'session': self.label, 'total_seconds': self.total_seconds, 'peak_mb': self.peak_mb,
+                'rss_peak_mb': self.rss_peak_mb, 'stages': self.stages, 'bytes_read': self.bytes_read,
+                'counts': self.counts}
+
+
+class Profiled:
+    """Picklable worker wrapper: func(path, *args) -> (result, profile dict)."""
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, path, *args):
+        with SessionProfile(os.path.basename(path)) as profile:
+            result = self.func(path, *args)
+        return result, profile.to_dict()
+
+
+def add_profile_argument(parser):
+    parser.add_argument('--profile', action='store_true',
+                        help='record per-session/per-stage time, memory and bytes read (bypasses the cache)')
+
+
+class BatchProfiler:
+    """Collects worker profiles for a batch; every method is a pass-through when disabled."""
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.records = []
+        self.batch = SessionProfile('(batch)')
+
+    def wrap(self, func):
+        return Profiled(func) if self.enabled else func
+
+    def collect(self, path, result):
+        """Strip and keep the profile from a wrapped worker's result."""
+        if not self.enabled or result is None:
+            return result
+        result, record = result
+        record['pid'], record['run'] = session_key(path)
+        self.records.append(record)
+        return result
+
+    def stage(self, name):
+        """Time a main-process step into the '(batch)' record."""
+        if not self.enabled:
+            return _NO_STAGE
+        return _BatchStage(self.batch, name)
+
+    def write(self, out_dir, name):
+        """Write <out_dir>/profile/<name>_profile.{json,csv}; returns the JSON path (None when disabled)."""
+        if not self.enabled:
+            return None
+        records = self.records + [dict(self.batch.to_dict(), pid='(batch)', run='')]
+        folder = os.path.join(out_dir, 'profile')
+        os.makedirs(folder, exist_ok=True)
+        json_path = os.path.join(folder, f"{name}_profile.json")
+        with open(json_path, 'w') as f:
+            json.dump({'script': name, 'sessions': records}, f, indent=2)
+
+        fields = ['pid', 'run', 'session', 'kind', 'name', 'calls', 'seconds', 'peak_mb', 'value']
+        with open(os.path.join(folder, f"{name}_profile.csv"), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, lineterminator='\n')
+            writer.writeheader()
+            for rec in records:
+                base = {'pid': rec['pid'], 'run': rec['run'], 'session': rec['session']}
+                # value of the session row is the process RSS high-water mark (MB)
+                writer.writerow(dict(base, kind='session', name='total', seconds=rec['total_seconds'],
+                                     peak_mb=rec['peak_mb'], value=rec['rss_peak_mb']))
+                for stage_name, st in rec['stages'].items():
+                    writer.writerow(dict(base, kind='stage', name=stage_name, **st))
+                for dataset, n in rec['bytes_read'].items():
+                    writer.writerow(dict(base, kind='bytes_read', name=dataset, value=n))
+                for count_name, n in rec['counts'].items():
+                    writer.writerow(dict(base, kind='count', name=count_name, value=n))
+        return json_path
+
+    def summary(self):
+        """Slowest stages summed over sessions (one line each)."""
+        totals = {}
+        for rec in self.records + [self.batch.to_dict()]:
+            for stage_name, st in rec['stages'].items():
+                totals[stage_name] = totals.get(stage_name, 0.0) + st['seconds']
+        lines = [f"  {stage_name:<28} {seconds:>9.3f}s"
+                 for stage_name, seconds in sorted(totals.items(), key=lambda kv: -kv[1])]
+        return "Profile (summed over sessions):\n" + "\n".join(lines)
+
+
+class _BatchStage:
+    """Activates the batch profile around one main-process step, so library stages inside it nest."""
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        _active = self.profile
+        self._t0 = time.perf_counter()
+        self._stage = self.profile.stage(self.name).__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        self._stage.__exit__(*exc)
+        if self._started_tracing:
+            tracemalloc.stop()
+        _active = self._previous
+        self.profile.total_seconds += time.perf_counter() - self._t0
+        self.profile.peak_mb = max(st['peak_mb'] for st in self.profile.stages.values())
+        self.profile.rss_peak_mb = rss_peak_mb()
+        return False
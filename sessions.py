@@ -0,0 +1,119 @@
+'''
+Session discovery and the per-session loop shared by the extraction scripts.
+run_sessions() calls a worker once per .nwb file, either in-process (jobs=1) or in a process pool
+(--jobs N). Results come back in sorted path order whatever order the workers finish in, and a
+failing file is reported as an error string without stopping the rest of the batch.
+Workers must be module-level functions (picklable), and scripts using jobs > 1 must keep their
+batch code under `if __name__ == '__main__':` (Windows spawns fresh interpreters).
+With load=..., reading and computing are split: the worker gets func(load(path), *args). In a serial
+run, prefetch_sessions() then loads the next `prefetch` sessions in background threads while the
+current one is processed (bounded: a session is only submitted when one is taken, so at most
+prefetch + 1 sessions are in memory, the one being processed and prefetch loaded or loading ahead). Each prefetch first reads the raw bytes of the behavior and trials
+datasets (nwb_session.warm_session), which does not hold the GIL, so slow network reads overlap the
+computation. With jobs > 1 the worker processes already overlap each other's reads.
+'''
+import os
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def find_sessions(data_path):
+    """All .nwb files under data_path, sorted by path (deterministic batch order)."""
+    paths = []
+    for root, _, files in os.walk(data_path):
+        for f_name in files:
+            if f_name.endswith('.nwb'):
+                paths.append(os.path.join(root, f_name))
+    return sorted(paths)
+
+
+def session_key(path):
+    """(pid, run_key) from the file name, e.g. sub-CS41_ses-P41CSR1_... -> ('sub-CS41', 'R1')."""
+    f_name = os.path.basename(path)
+    pid = f_name.split('_')[0]
+    run_key = 'R1' if 'CSR1' in f_name else 'R2'
+    return pid, run_key
+
+
+def add_jobs_argument(parser):
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='worker processes, one session file each (0 = all cores, default 1)')
+
+
+def add_prefetch_argument(parser):
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='sessions read ahead in background threads when --jobs 1 (0 = off, default 2); '
+                             'up to N + 1 sessions are held in memory')
+
+
+def _call(func, path, args):
+    """Run func(path, *args) and turn any exception into an error string (always picklable)."""
+    try:
+        return func(path, *args), None
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+
+
+def _load_call(func, load, path, *args):
+    return func(load(path), *args)
+
+
+def _prefetch_load(load, path):
+    from nwb_session import warm_session
+    warm_session(path)
+    return load(path)
+
+
+def prefetch_sessions(load, paths, depth=2):
+    """Yield (path, load(path), error) in order, loading up to depth sessions ahead in threads
+    (depth + 1 sessions held while the consumer works on the yielded one)."""
+    paths = iter(paths)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max(1, depth)) as pool:
+        def submit():
+            path = next(paths, None)
+            if path is not None:
+                pending.append((path, pool.submit(_call, partial(_prefetch_load, load), path, ())))
+
+        for _ in range(max(1, depth)):
+            submit()
+        while pending:
+            path, fut = pending.popleft()
+            result, error = fut.result()
+            submit()
+            yield path, result, error
+            # drop the reference before the next wait: the yielded session plus `depth` ahead are held
+            result = None
+
+
+def run_sessions(func, paths, jobs=1, args=(), load=None, prefetch=0):
+    """Yield (path, result, error) for every path in the given order; error is None on success.
+    With load, func receives load(path) instead of the path (prefetched in serial runs, see above)."""
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or len(paths) <= 1:
+        if load is not None and prefetch > 0:
+            for path, loaded, error in prefetch_sessions(load, paths, prefetch):
+                result = None
+                if error is None:
+                    result, error = _call(func, loaded, args)
+                loaded = None
+                yield path, result, error
+            return
+        if load is not None:
+            func = partial(_load_call, func, load)
+        for path in paths:
+            result, error = _call(func, path, args)
+            yield path, result, error
+        return
+    if load is not None:
+        func = partial(_load_call, func, load)
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as pool:
+        futures = [pool.submit(_call, func, path, args) for path in paths]
+        for path, fut in zip(paths, futures):
+            try:
+                result, error = fut.result()
+            except Exception as e:  # worker process died (e.g. out of memory)
+                result, error = None, str(e) or type(e).__name__
+            yield path, result, error
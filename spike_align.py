@@ -0,0 +1,167 @@
+'''
+Spike-to-gaze-event alignment: peri-event rasters and PSTHs of every unit around fixation or saccade onsets.
+-> onsets: starts of the chosen event type in the phase-split events (computed like sac_fix.py, or read
+   from an existing store/.npz/.pkl with --events, optionally without blink-flagged events)
+-> spikes: units/spike_times + spike_times_index read straight from the file with h5py
+For each unit one searchsorted call over its sorted spike times gives the spike positions at every bin
+edge of every onset, so bin counts, raster ranges and PSTHs are array operations (no loop over spikes).
+Results per session and phase, saved to pkl/spike_alignment/<event>/<pid>_<run>.npz with keys '<phase>/<name>':
+-> onsets (n_events,)                   event onset times (s)
+-> counts (n_units, n_events, n_bins)   uint16 spike counts per bin
+-> psth (n_units, n_bins)               float32 mean rate (Hz)
+-> raster_offsets (n_units * n_events + 1,) and raster_times (float32, s from onset): spikes of unit u
+   around event e are raster_times[raster_offsets[u * n_events + e]:raster_offsets[u * n_events + e + 1]]
+plus unit_ids and edges (bin edges in s from onset) shared by both phases. load_alignment() reads one back.
+'''
+import os
+import argparse
+import h5py
+import numpy as np
+import config
+from eye_events import TYPE_CODES
+from sessions import find_sessions, session_key, run_sessions, add_jobs_argument
+
+data_path = config.data_path
+output_folder = config.pkl_folder
+
+UNITS_PATH = 'units'
+PHASES = ('Encoding', 'Recognition')
+
+
+def read_units(full_path):
+    """(unit_ids, spike trains): one sorted array of spike times per unit (the ragged column split at
+    spike_times_index; no trains for an empty Units table)."""
+    with h5py.File(full_path, 'r') as f:
+        if UNITS_PATH not in f or 'spike_times' not in f[UNITS_PATH]:
+            raise ValueError('no Units table with spike_times')
+        units = f[UNITS_PATH]
+        spike_times = np.asarray(units['spike_times'][:], dtype=np.float64)
+        ends = np.asarray(units['spike_times_index'][:], dtype=np.int64)
+        unit_ids = np.asarray(units['id'][:])
+    starts = np.concatenate([[0], ends[:-1]])
+    unit_spikes = []
+    for lo, hi in zip(starts, ends):
+        spikes = spike_times[lo:hi]
+        unit_spikes.append(spikes if np.all(np.diff(spikes) >= 0) else np.sort(spikes))
+    return unit_ids, unit_spikes
+
+
+def bin_edges(pre, post, bin_size):
+    """Bin edges from -pre to post (s from onset)."""
+    n_bins = int(round((pre + post) / bin_size))
+    return np.linspace(-pre, post, n_bins + 1)
+
+
+def align_unit(spikes, onsets, edges):
+    """(counts (n_events, n_bins), raster_counts (n_events,), raster_times) for one sorted spike train.
+    Spikes in [onset + edges[0], onset + edges[-1]) go into the raster, relative to their onset."""
+    pos = np.searchsorted(spikes, onsets[:, None] + edges[None, :], side='left')
+    counts = np.diff(pos, axis=1)
+    lo, hi = pos[:, 0], pos[:, -1]
+    n = hi - lo
+    offsets = np.cumsum(n) - n
+    idx = np.arange(n.sum()) + np.repeat(lo - offsets, n)
+    return counts, n, spikes[idx] - np.repeat(onsets, n)
+
+
+def align_units(unit_spikes, onsets, edges):
+    """Arrays of one phase (see module docstring) for a list of sorted spike trains."""
+    onsets = np.sort(np.asarray(onsets, dtype=np.float64))
+    n_bins = len(edges) - 1
+    counts = np.zeros((len(unit_spikes), len(onsets), n_bins), dtype=np.uint16)
+    raster_n, raster_times = [], []
+    for u, spikes in enumerate(unit_spikes):
+        c, n, rel = align_unit(spikes, onsets, edges)
+        counts[u] = np.minimum(c, np.iinfo(np.uint16).max)
+        raster_n.append(n)
+        raster_times.append(rel.astype(np.float32))
+    n_all = np.concatenate(raster_n) if raster_n else np.empty(0, dtype=np.int64)
+    with np.errstate(invalid='ignore'):
+        psth = counts.mean(axis=1) / np.diff(edges) if len(onsets) else np.full((len(unit_spikes), n_bins), np.nan)
+    return {
+        'onsets': onsets,
+        'counts': counts,
+        'psth': psth.astype(np.float32),
+        'raster_offsets': np.concatenate([[0], np.cumsum(n_all)]).astype(np.int64),
+        'raster_times': np.concatenate(raster_times) if raster_times else np.empty(0, dtype=np.float32),
+    }
+
+
+def session_onsets(full_path, event_type, events_path=None, exclude_artifacts=False):
+    """{phase: onset times} of event_type from the phase-split events of one session."""
+    if events_path is None:
+        from sac_fix import process_session
+        phases = dict(zip(PHASES, process_session(full_path)))
+    else:
+        from event_store import load_any
+        pid, run_key = session_key(full_path)
+        phases = load_any(events_path, pid, run_key).get(pid, {}).get(run_key)
+        if not phases:
+            raise ValueError(f"no events for {pid} {run_key} in {events_path}")
+    onsets = {}
+    for phase in PHASES:
+        events = phases[phase]
+        keep = np.asarray(events['type']) == TYPE_CODES[event_type]
+        if exclude_artifacts:
+            if 'is_artifact' not in events:
+                raise ValueError(f"{events_path} has no is_artifact column (use the flagged events)")
+            keep &= ~np.asarray(events['is_artifact'], dtype=bool)
+        onsets[phase] = np.asarray(events['start'])[keep]
+    return onsets
+
+
+def align_session(full_path, event_type='Fixation', pre=0.5, post=1.0, bin_size=0.05, events_path=None,
+                  exclude_artifacts=False):
+    """Flat {'unit_ids', 'edges', '<phase>/<name>': array} for one session (the .npz contents)."""
+    unit_ids, unit_spikes = read_units(full_path)
+    edges = bin_edges(pre, post, bin_size)
+    arrays = {'unit_ids': unit_ids, 'edges': edges}
+    for phase, onsets in session_onsets(full_path, event_type, events_path, exclude_artifacts).items():
+        for name, arr in align_units(unit_spikes, onsets, edges).items():
+            arrays[f"{phase}/{name}"] = arr
+    return arrays
+
+
+def load_alignment(npz_path, phase=None):
+    """{'unit_ids', 'edges', phase: {name: array}} from an align_session() .npz (one phase if given)."""
+    out = {}
+    with np.load(npz_path) as npz:
+        for key in npz.files:
+            if '/' not in key:
+                out[key] = npz[key]
+                continue
+            ph, name = key.split('/')
+            if phase in (None, ph):
+                out.setdefault(ph, {})[name] = npz[key]
+    return out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Peri-event spike rasters and PSTHs around gaze events.')
+    add_jobs_argument(parser)
+    parser.add_argument('--event', choices=('Fixation', 'Saccade'), default='Fixation', help='align to these onsets')
+    parser.add_argument('--pre', type=float, default=0.5, help='seconds before onset')
+    parser.add_argument('--post', type=float, default=1.0, help='seconds after onset')
+    parser.add_argument('--bin', type=float, default=0.05, help='PSTH bin width (s)')
+    parser.add_argument('--events', default=None, help='event store/.npz/.pkl to take onsets from (default: extract)')
+    parser.add_argument('--exclude-artifacts', action='store_true', help='drop blink-flagged events (flagged store)')
+    args = parser.parse_args()
+
+    out_dir = os.path.join(output_folder, 'spike_alignment', args.event)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = find_sessions(data_path)
+    print(f"Aligning spikes to {args.event} onsets ({-args.pre:+.2f}..{args.post:+.2f}s, {args.bin}s bins) "
+          f"for {len(paths)} sessions...\n")
+    n_saved = 0
+    for full_path, arrays, error in run_sessions(align_session, paths, args.jobs,
+                                                 (args.event, args.pre, args.post, args.bin, args.events,
+                                                  args.exclude_artifacts)):
+        pid, run_key = session_key(full_path)
+        if error is not None:
+            print(f"Skipping {pid} ({run_key}): {error}")
+            continue
+        np.savez(os.path.join(out_dir, f"{pid}_{run_key}.npz"), **arrays)
+        n_saved += 1
+        counts = ', '.join(f"{phase} {len(arrays[f'{phase}/onsets'])}" for phase in PHASES)
+        print(f"{pid} ({run_key}): {len(arrays['unit_ids'])} units, onsets {counts}")
+    print(f"\n{n_saved} sessions saved to: {out_dir}")
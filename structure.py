@@ -3,11 +3,11 @@ This script provides an audit tool to inspect different NWB fields in one place.
 It checks high-level behavior metrics, raw eye positions, and the trial timeline.
 '''
 from pynwb import NWBHDF5IO
-import pandas as pd
 import os
+import config
 
-# file path
-f_path = r'E:\000623\sub-CS51\sub-CS51_ses-P51CSR1_behavior+ecephys.nwb'
+# file path (data folder from config.py)
+f_path = config.session_path('sub-CS51', 'R1')
 
 if os.path.exists(f_path):
     with NWBHDF5IO(f_path, 'r') as io:
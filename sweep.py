@@ -0,0 +1,198 @@
+'''
+Robustness sweep over the two hard-coded analysis choices, in one pass per session:
+-> blink margin m: an event is blink-contaminated if it overlaps a blink padded to [start - m, end + m]
+   (capture_all.py / blink_removal.py use m = 0, strict overlap); 'none' = no blink exclusion (plots2.py)
+-> window rule for the Encoding/Recognition assignment (encoding wins if both match):
+   'inside' event fully inside the window (the split used everywhere), 'start' event starts inside it,
+   'overlap' event overlaps it at all (windows inclusive at both ends)
+Each event's contamination threshold (the smallest margin at which some blink touches it) comes from one
+searchsorted pass over the sorted blinks (see margin_thresholds), so contamination for every margin is a
+broadcast comparison, and per-phase sums for every (rule, margin) pair are one matrix product.
+Writes one tidy table, pkl/sweep_blink_window.csv, with per patient (runs pooled), phase, rule and margin:
+events, contaminated events, contaminating blinks and the plots2.py metrics over the clean events.
+'''
+import os
+import csv
+import argparse
+import numpy as np
+import config
+from pipeline import load_session, IGNORE_PATIENTS
+from sessions import find_sessions, session_key, run_sessions, add_jobs_argument, add_prefetch_argument
+
+data_path = config.data_path
+output_folder = config.pkl_folder
+
+WINDOW_RULES = ('inside', 'start', 'overlap')
+DEFAULT_MARGINS = (0.0, 0.025, 0.05, 0.1, 0.2, 0.5)
+PHASES = ('Encoding', 'Recognition')
+# metric name -> (event set, column), as in pipeline.phase_summary_rows
+SWEEP_METRICS = {
+    'Fixation_Dur': ('fixations', 'duration'),
+    'Avg_Pupil': ('fixations', 'pupil_size'),
+    'Saccade_Dur': ('saccades', 'duration'),
+    'Saccade_Amp': ('saccades', 'amplitude'),
+    'Saccade_Velo': ('saccades', 'velocity'),
+}
+COUNT_FIELDS = ('n_events', 'n_contaminated', 'contaminating_blinks')
+
+
+def margin_thresholds(start, end, iv_start, iv_end):
+    """Per [start, end), the margin above which an interval of iv_* padded by it overlaps:
+    -inf if one already overlaps strictly (blink_start < end and blink_end > start), inf if there are none.
+    Overlap at margin m <=> iv_start - m < end and iv_end + m > start <=> m > max(iv_start - end, start - iv_end)."""
+    start = np.asarray(start, dtype=np.float64)
+    end = np.asarray(end, dtype=np.float64)
+    iv_start = np.asarray(iv_start, dtype=np.float64)
+    iv_end = np.asarray(iv_end, dtype=np.float64)
+    thr = np.full(len(start), np.inf)
+    keep = np.flatnonzero(~(np.isnan(iv_start) | np.isnan(iv_end)))
+    valid = ~(np.isnan(start) | np.isnan(end))
+    if len(keep) == 0 or len(start) == 0:
+        return thr
+    order = keep[np.argsort(iv_start[keep], kind='stable')]
+    s_sorted = iv_start[order]
+    run_max = np.maximum.accumulate(iv_end[order])
+
+    k = np.searchsorted(s_sorted, end, side='left')
+    # intervals starting before end: the latest-ending one is the closest (or overlaps)
+    before = np.where(valid & (k > 0), start - run_max[np.maximum(k - 1, 0)], np.inf)
+    before[before < 0] = -np.inf
+    # intervals starting at/after end: the first one is the closest
+    after = np.where(valid & (k < len(s_sorted)), s_sorted[np.minimum(k, len(s_sorted) - 1)] - end, np.inf)
+    thr[valid] = np.minimum(before, after)[valid]
+    return thr
+
+
+def margin_value(value):
+    """argparse type for --margins: blinks can only be padded (a strictly overlapping event has threshold
+    -inf in margin_thresholds, so shrunk blinks, m < 0, are not represented)."""
+    m = float(value)
+    if not m >= 0:
+        raise argparse.ArgumentTypeError(f"blink margins must be >= 0, got {value}")
+    return m
+
+
+def window_masks(start, end, enco_window, reco_window):
+    """(n_rules, n) masks of (encoding, recognition) membership for every WINDOW_RULES rule."""
+    def member(window, rule):
+        ws, we = window
+        if rule == 'inside':
+            return (ws <= start) & (end <= we)
+        if rule == 'start':
+            return (ws <= start) & (start <= we)
+        return (start <= we) & (end >= ws)
+
+    enco = np.array([member(enco_window, rule) for rule in WINDOW_RULES]).reshape(len(WINDOW_RULES), -1)
+    reco = np.array([member(reco_window, rule) for rule in WINDOW_RULES]).reshape(len(WINDOW_RULES), -1) & ~enco
+    return enco, reco
+
+
+def sweep_session(session, margins=DEFAULT_MARGINS):
+    """{'counts': {field: (phase, rule, margin)}, 'sums'/'n': {metric: (phase, rule, margin)}} for one
+    loaded session (pipeline.load_session). The margin axis has len(margins) + 1 entries, the first
+    being 'none' (no blink exclusion)."""
+    blinks = session['blinks']
+    margins = np.asarray(margins, dtype=np.float64)
+    if not np.all(margins >= 0):
+        raise ValueError(f"blink margins must be >= 0, got {margins.tolist()}")
+    windows = (session['enco_window'], session['reco_window'])
+
+    out = {'counts': {}, 'sums': {}, 'n': {}}
+    n_shape = (len(PHASES), len(WINDOW_RULES), len(margins) + 1)
+    for field in COUNT_FIELDS:
+        out['counts'][field] = np.zeros(n_shape, dtype=np.int64)
+
+    blink_thr = np.full(len(blinks['start']), np.inf)
+    for name in ('saccades', 'fixations'):
+        events = session[name]
+        thr = margin_thresholds(events['start'], events['end'], blinks['start'], blinks['end'])
+        blink_thr = np.minimum(blink_thr, margin_thresholds(blinks['start'], blinks['end'],
+                                                            events['start'], events['end']))
+        # clean[e, j]: event e kept at margin j (column 0: no exclusion)
+        clean = np.column_stack([np.ones(len(thr), dtype=bool)] + [~(thr < m) for m in margins])
+        for p, masks in enumerate(window_masks(events['start'], events['end'], *windows)):
+            masks = masks.astype(np.float64)
+            out['counts']['n_events'][p] += np.rint(masks.sum(axis=1)).astype(np.int64)[:, None]
+            out['counts']['n_contaminated'][p] += np.rint(masks @ (~clean)).astype(np.int64)
+            for metric, (source, col) in SWEEP_METRICS.items():
+                if source != name:
+                    continue
+                values = np.asarray(events[col], dtype=np.float64)
+                finite = ~np.isnan(values)
+                out['sums'].setdefault(metric, np.zeros(n_shape))[p] = (masks * np.where(finite, values, 0.0)) @ clean
+                out['n'].setdefault(metric, np.zeros(n_shape))[p] = (masks * finite) @ clean
+
+    contaminating = np.column_stack([np.zeros(len(blink_thr), dtype=bool)] + [blink_thr < m for m in margins])
+    for p, masks in enumerate(window_masks(blinks['start'], blinks['end'], *windows)):
+        out['counts']['contaminating_blinks'][p] = np.rint(masks.astype(np.float64) @ contaminating).astype(np.int64)
+    return out
+
+
+def tidy_rows(totals, margins):
+    """One row per (pid, phase, rule, margin) from per-patient summed session results."""
+    labels = ['none'] + [f"{m:g}" for m in margins]
+    rows = []
+    for pid in sorted(totals):
+        total = totals[pid]
+        for p, phase in enumerate(PHASES):
+            for r, rule in enumerate(WINDOW_RULES):
+                for j, margin in enumerate(labels):
+                    row = {'pid': pid, 'phase': phase, 'rule': rule, 'margin': margin}
+                    for field in COUNT_FIELDS:
+                        row[field] = int(total['counts'][field][p, r, j])
+                    for metric in SWEEP_METRICS:
+                        n = total['n'][metric][p, r, j]
+                        row[metric] = total['sums'][metric][p, r, j] / n if n else np.nan
+                    rows.append(row)
+    return rows
+
+
+def add_totals(total, result):
+    if total is None:
+        return result
+    for group in ('counts', 'sums', 'n'):
+        for key, arr in result[group].items():
+            total[group][key] = total[group][key] + arr
+    return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep blink margins and phase-window rules in one pass.')
+    add_jobs_argument(parser)
+    add_prefetch_argument(parser)
+    parser.add_argument('--margins', type=margin_value, nargs='+', default=DEFAULT_MARGINS,
+                        help='blink padding (s, >= 0)')
+    args = parser.parse_args()
+    margins = sorted(set(args.margins))
+
+    paths = [p for p in find_sessions(data_path) if session_key(p)[0] not in IGNORE_PATIENTS]
+    print(f"Sweeping {len(margins)} blink margins x {len(WINDOW_RULES)} window rules over {len(paths)} sessions...\n")
+    totals = {}
+    for full_path, result, error in run_sessions(sweep_session, paths, args.jobs, (margins,), load_session,
+                                                     args.prefetch):
+        pid, run_key = session_key(full_path)
+        if error is not None:
+            print(f"Error in {pid} ({run_key}): {error}")
+            continue
+        totals[pid] = add_totals(totals.get(pid), result)
+
+    rows = tidy_rows(totals, margins)
+    os.makedirs(output_folder, exist_ok=True)
+    out_path = os.path.join(output_folder, 'sweep_blink_window.csv')
+    with open(out_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ['pid'], lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+
+    # Does Recognition > Encoding fixation duration hold across settings?
+    print(f"{'rule':<8} {'margin':>6} | patients with Recognition > Encoding fixation duration")
+    for rule in WINDOW_RULES:
+        for margin in ['none'] + [f"{m:g}" for m in margins]:
+            diffs = {}
+            for row in rows:
+                if row['rule'] == rule and row['margin'] == margin:
+                    diffs.setdefault(row['pid'], {})[row['phase']] = row['Fixation_Dur']
+            d = [v['Recognition'] - v['Encoding'] for v in diffs.values() if len(v) == 2]
+            d = [x for x in d if not np.isnan(x)]
+            print(f"{rule:<8} {margin:>6} | {sum(x > 0 for x in d)}/{len(d)}")
+    print(f"\nSweep table saved to: {out_path}")
@@ -0,0 +1,169 @@
+'''
+Writes synthetic behavior NWB files with the same layout as dandiset 000623, for benchmarks and
+checks on machines without the real data.
+-> processing/behavior: Saccade, Fixation, Blink (BehavioralTimeSeries with one 'TimeSeries' each)
+   and EyeTracking (SpatialSeries of raw X/Y gaze samples)
+-> intervals/trials: one encoding row, then N recognition rows with stim_phase and response_correct
+-> units (optional, --units): Poisson spike trains; every other unit also fires after fixation onsets
+-> acquisition/LFP (optional, --lfp-channels): ElectricalSeries with a 6 Hz theta rhythm whose phase resets
+   to 0 at every fixation onset, plus noise
+Saccade data columns: 0=duration, 1=startX, 2=startY, 3=endX, 4=endY, 5=amplitude, 6=velocity, 7=pupil_vel
+Fixation data columns: 0=duration, 1=x, 2=y, 3=pupil_avg. Blink data: duration (1D).
+Files are written as <out>/sub-CS<id>/sub-CS<id>_ses-P<id>CSR<run>_behavior+ecephys.nwb
+'''
+import os
+import argparse
+from datetime import datetime, timezone
+import numpy as np
+from pynwb import NWBFile, NWBHDF5IO, TimeSeries
+from pynwb.behavior import BehavioralTimeSeries, EyeTracking, SpatialSeries
+from pynwb.ecephys import ElectricalSeries
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_trials(rng, duration_s, n_reco):
+    """(start, stop, phase, correct): one encoding block over the first ~60%, a gap, then n_reco trials."""
+    enco_stop = 0.6 * duration_s
+    reco_start = enco_stop + 0.02 * duration_s
+    edges = np.linspace(reco_start, duration_s, n_reco + 1)
+    starts = np.concatenate([[0.0], edges[:-1]])
+    stops = np.concatenate([[enco_stop], edges[1:] - 0.2])
+    phases = ['encoding'] + ['recognition'] * n_reco
+    correct = np.concatenate([[np.nan], rng.integers(0, 2, n_reco).astype(float)])
+    return starts, stops, phases, correct
+
+
+def make_events(rng, duration_s, n_fix, n_blinks=None):
+    """Alternating saccade/fixation stream plus independent blinks (default one per 4 s) covering [0, duration_s)."""
+    fix_dur = rng.gamma(4.0, 0.06, n_fix)
+    sac_dur = rng.gamma(3.0, 0.012, n_fix)
+    scale = duration_s / (fix_dur.sum() + sac_dur.sum())
+    fix_dur *= scale
+    sac_dur *= scale
+    steps = np.empty(2 * n_fix)
+    steps[0::2] = sac_dur
+    steps[1::2] = fix_dur
+    onsets = np.concatenate([[0.0], np.cumsum(steps)[:-1]])
+    sac_t, fix_t = onsets[0::2], onsets[1::2]
+
+    sac = np.empty((n_fix, 8))
+    sac[:, 0] = sac_dur
+    sac[:, 1:5] = rng.uniform(0, 1000, (n_fix, 4))
+    sac[:, 5] = np.hypot(sac[:, 3] - sac[:, 1], sac[:, 4] - sac[:, 2]) / 40.0
+    sac[:, 6] = sac[:, 5] / np.maximum(sac_dur, 1e-3)
+    sac[:, 7] = rng.normal(0, 1, n_fix)
+
+    fix = np.empty((n_fix, 4))
+    fix[:, 0] = fix_dur
+    fix[:, 1:3] = rng.uniform(0, 1000, (n_fix, 2))
+    fix[:, 3] = rng.normal(1200, 150, n_fix)
+
+    if n_blinks is None:
+        n_blinks = max(1, int(duration_s / 4))
+    blink_t = np.sort(rng.uniform(0, duration_s, n_blinks))
+    blink_dur = rng.gamma(5.0, 0.03, n_blinks)
+    return (sac_t, sac), (fix_t, fix), (blink_t, blink_dur)
+
+
+def make_gaze(rng, duration_s, rate):
+    """Random-walk X/Y gaze samples at rate Hz."""
+    n = int(duration_s * rate)
+    xy = 500 + np.cumsum(rng.normal(0, 2, (n, 2)), axis=0)
+    return np.clip(xy, 0, 1000)
+
+
+def make_units(rng, duration_s, n_units, fix_t):
+    """Sorted spike times per unit: 1-10 Hz background, odd units add a spike ~80 ms after 30% of fixation onsets."""
+    units = []
+    for i in range(n_units):
+        rate = rng.uniform(1.0, 10.0)
+        spikes = rng.uniform(0, duration_s, rng.poisson(rate * duration_s))
+        if i % 2:
+            onsets = fix_t[rng.random(len(fix_t)) < 0.3]
+            spikes = np.concatenate([spikes, onsets + rng.gamma(8.0, 0.01, len(onsets))])
+        units.append(np.sort(spikes))
+    return units
+
+
+def make_lfp(rng, duration_s, rate, n_channels, fix_t, theta_hz=6.0):
+    """(n_samples, n_channels) float32 volts: theta phase-reset at fixation onsets (per-channel lag) + noise."""
+    t = np.arange(int(duration_s * rate)) / rate
+    last = np.searchsorted(fix_t, t, side='right') - 1
+    since = t - np.where(last >= 0, fix_t[np.maximum(last, 0)], 0.0)
+    lags = rng.uniform(0, 0.5, n_channels)
+    lfp = 50e-6 * np.sin(2 * np.pi * theta_hz * since[:, None] + lags[None, :])
+    lfp += rng.normal(0, 20e-6, lfp.shape)
+    return lfp.astype(np.float32)
+
+
+def write_session(path, seed=0, duration_s=1800.0, n_fix=6000, n_reco=40, gaze_rate=500.0, n_blinks=None,
+                  n_units=0, lfp_channels=0, lfp_rate=1000.0):
+    """Write one synthetic session to path."""
+    rng = np.random.default_rng(seed)
+    nwb = NWBFile(session_description='synthetic eyetracking session', identifier=os.path.basename(path),
+                  session_start_time=datetime(2020, 1, 1, tzinfo=timezone.utc))
+    beh = nwb.create_processing_module('behavior', 'synthetic eye tracking')
+
+    (sac_t, sac), (fix_t, fix), (blink_t, blink_dur) = make_events(rng, duration_s, n_fix, n_blinks)
+    for name, t, data in (('Saccade', sac_t, sac), ('Fixation', fix_t, fix), ('Blink', blink_t, blink_dur)):
+        ts = TimeSeries(name='TimeSeries', data=data, timestamps=t, unit='s')
+        beh.add(BehavioralTimeSeries(time_series=ts, name=name))
+
+    if gaze_rate > 0:
+        spatial = SpatialSeries(name='SpatialSeries', data=make_gaze(rng, duration_s, gaze_rate),
+                                reference_frame='screen pixels', starting_time=0.0, rate=gaze_rate, unit='px')
+        beh.add(EyeTracking(spatial_series=spatial, name='EyeTracking'))
+
+    nwb.add_trial_column('stim_phase', 'encoding or recognition')
+    nwb.add_trial_column('response_correct', '1 correct, 0 incorrect (recognition only)')
+    for start, stop, phase, correct in zip(*make_trials(rng, duration_s, n_reco)):
+        nwb.add_trial(start_time=start, stop_time=stop, stim_phase=phase, response_correct=correct)
+
+    for spikes in make_units(rng, duration_s, n_units, fix_t):
+        nwb.add_unit(spike_times=spikes)
+
+    if lfp_channels > 0:
+        device = nwb.create_device(name='array')
+        group = nwb.create_electrode_group('shank', description='synthetic', location='unknown', device=device)
+        for _ in range(lfp_channels):
+            nwb.add_electrode(group=group, location='unknown')
+        electrodes = nwb.create_electrode_table_region(list(range(lfp_channels)), 'all electrodes')
+        nwb.add_acquisition(ElectricalSeries(name='LFP', data=make_lfp(rng, duration_s, lfp_rate, lfp_channels, fix_t),
+                                             electrodes=electrodes, starting_time=0.0, rate=lfp_rate))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with NWBHDF5IO(path, 'w') as io:
+        io.write(nwb)
+
+
+def write_cohort(out_dir, n_patients=2, runs=('R1', 'R2'), **kwargs):
+    """Write n_patients x runs sessions under out_dir; returns the file paths."""
+    paths = []
+    for i in range(n_patients):
+        sub = 41 + i
+        for run in runs:
+            f_name = f"sub-CS{sub}_ses-P{sub}CS{run}_behavior+ecephys.nwb"
+            path = os.path.join(out_dir, f"sub-CS{sub}", f_name)
+            write_session(path, seed=sub * 10 + int(run[1]), **kwargs)
+            paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic behavior NWB files.')
+    parser.add_argument('--out', default=os.path.join(current_dir, 'synthetic nwb files'))
+    parser.add_argument('--patients', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=1800.0, help='recording length (s)')
+    parser.add_argument('--fixations', type=int, default=6000, help='fixations (and saccades) per session')
+    parser.add_argument('--blinks', type=int, default=None, help='blinks per session (default one per 4 s)')
+    parser.add_argument('--reco-trials', type=int, default=40)
+    parser.add_argument('--gaze-rate', type=float, default=500.0, help='raw gaze Hz (0 = no EyeTracking)')
+    parser.add_argument('--units', type=int, default=0, help='sorted units with spike times (0 = no Units table)')
+    parser.add_argument('--lfp-channels', type=int, default=0, help='LFP ElectricalSeries channels (0 = none)')
+    parser.add_argument('--lfp-rate', type=float, default=1000.0, help='LFP sampling rate (Hz)')
+    args = parser.parse_args()
+    paths = write_cohort(args.out, args.patients, duration_s=args.duration, n_fix=args.fixations,
+                         n_reco=args.reco_trials, gaze_rate=args.gaze_rate, n_blinks=args.blinks,
+                         n_units=args.units, lfp_channels=args.lfp_channels, lfp_rate=args.lfp_rate)
+    print(f"Wrote {len(paths)} files to {args.out}")
@@ -1,30 +1,43 @@
-'''Converts the pickle of flagged eye events to a table for viewing. Uses standard format: type, duration, amplitude, 
-velocity, pupil_size, is_artifact. start,end can be added if neeeded '''
-import pickle
+'''Converts one slice of the flagged eye events to a table for viewing. Uses standard format: type, duration, amplitude,
+velocity, pupil_size, is_artifact. start,end can be added if neeeded
+The slice is read with EventStore.query (only the matching partitions and rows are loaded; falls back to
+flagged_eye_events.pkl), e.g. python table.py --pid sub-CS41 --run R1 --phase Encoding --type Fixation --t-range 0 60'''
 import os
-import pandas as pd
+import argparse
+import config
+from event_store import is_store, EventStore
 
-current_dir = os.path.dirname(os.path.abspath(__file__))
-pkl_folder = os.path.join(current_dir, 'pkl')
+pkl_folder = config.pkl_folder
+store_path = os.path.join(pkl_folder, 'flagged_eye_events')
 pkl_path = os.path.join(pkl_folder, 'flagged_eye_events.pkl')
 
-with open(pkl_path, 'rb') as f:
-    master_dict = pickle.load(f)
-
 # Pick patient and run (R1/R2) and phase (Encoding/Recognition)
-pid, run, phase = 'sub-CS41', 'R1', 'Encoding'
-if pid not in master_dict or run not in master_dict[pid]:
-    print(f"{pid} {run} not in pickle.")
-else:
-    data_list = master_dict[pid][run][phase]
-    df = pd.DataFrame(data_list)
+parser = argparse.ArgumentParser(description='Print one slice of the flagged eye events.')
+parser.add_argument('--pid', default='sub-CS41')
+parser.add_argument('--run', default='R1', choices=('R1', 'R2'))
+parser.add_argument('--phase', default='Encoding', choices=('Encoding', 'Recognition'))
+parser.add_argument('--type', choices=('Saccade', 'Fixation'), help='only this event type')
+parser.add_argument('--artifacts', choices=('only', 'exclude'), help='only or no blink-flagged events')
+parser.add_argument('--t-range', type=float, nargs=2, metavar=('START', 'END'), help='events starting in [START, END) s')
+parser.add_argument('--csv', action='store_true', help='save the slice to pkl/<pid>_<run>_<phase>.csv')
+args = parser.parse_args()
+pid, run, phase = args.pid, args.run, args.phase
+
+source = store_path if is_store(store_path) else pkl_path
+artifact = None if args.artifacts is None else args.artifacts == 'only'
+events = EventStore(source)
+df = events.query(pid, run, phase, type=args.type, artifact=artifact, t_range=args.t_range)
+if df.empty and not events.partitions(pid, run, phase):
+    print(f"{pid} {run} not in {os.path.basename(source)}.")
+    df = None
 
+if df is not None:
     # Column order: standard keys only (no x, y, startX, etc.)
     cols = ['type', 'start', 'end', 'duration', 'amplitude', 'velocity', 'pupil_size', 'is_artifact']
     cols = [c for c in cols if c in df.columns]
     df = df[cols]
 
-    print(f"Table: {pid} {run} {phase} (first 10 rows):")
+    print(f"Table: {pid} {run} {phase}, {len(df)} events (first 10 rows):")
     print(df.head(10))
 
     if 'is_artifact' in df.columns and df['is_artifact'].any():
@@ -33,5 +46,5 @@ else:
     else:
         print("\nNo artifacts in this slice.")
 
-    # Optional: save to CSV
-    # df.to_csv(os.path.join(pkl_folder, f'{pid}_{run}_{phase}.csv'), index=False)
+    if args.csv:
+        df.to_csv(os.path.join(pkl_folder, f'{pid}_{run}_{phase}.csv'), index=False)
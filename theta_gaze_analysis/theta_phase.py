@@ -0,0 +1,215 @@
+'''
+Theta phase and power at fixation onsets from the LFP/iEEG ElectricalSeries of every session.
+The ElectricalSeries is never loaded whole: it is read in time chunks of one channel batch at a time,
+and each chunk is read with pad seconds of extra signal on both sides, band-passed forward and backward
+(scipy sosfiltfilt, zero phase), Hilbert-transformed, and only its central part is kept (overlap-save),
+so the filter and Hilbert edge effects fall in the discarded padding. Chunks without onsets are skipped.
+-> onsets: fixation starts of the phase-split events (spike_align.session_onsets: extracted like
+   sac_fix.py, or from --events), sampled at the nearest LFP sample
+-> onsets and their sample rows are prepared per session in a process pool (--jobs), then the work items
+   are (session, channel batch) run in the same way; a worker holds one padded
+   chunk x batch block at a time, so memory is bounded by --chunk, --pad and --batch, not by the file
+Per session pkl/theta_fixation/<pid>_<run>.npz has 'channels', 'band' and per phase '<phase>/onsets',
+'<phase>/phase' (rad) and '<phase>/amplitude' (n_onsets x n_channels, float32, in the series unit).
+pkl/theta_fixation_summary.csv has per session and phase the phase locking (mean resultant length of the
+onset phases, averaged over channels), the mean preferred phase and the mean theta amplitude.
+'''
+import os
+import sys
+import csv
+import argparse
+import h5py
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from nwb_session import H5TimeSeries
+from sessions import find_sessions, session_key, run_sessions, add_jobs_argument
+from spike_align import session_onsets, PHASES
+
+data_path = config.data_path
+output_folder = config.pkl_folder
+
+THETA_BAND = (4.0, 8.0)
+ONSET_CHUNK_ROWS = 1 << 20
+
+
+def find_electrical_series(f, name=None):
+    """HDF5 path of the ElectricalSeries called name, else the first one (processing/ before acquisition/)."""
+    found = []
+
+    def visit(path, obj):
+        kind = obj.attrs.get('neurodata_type') if isinstance(obj, h5py.Group) else None
+        if isinstance(kind, bytes):
+            kind = kind.decode()
+        if kind == 'ElectricalSeries' and (name is None or path.split('/')[-1] == name):
+            found.append(path)
+
+    f.visititems(visit)
+    if not found:
+        raise ValueError(f"no ElectricalSeries{' ' + name if name else ''} in file")
+    return sorted(found, key=lambda p: (not p.startswith('processing'), p))[0]
+
+
+def sampling_rate(series):
+    if series.timestamps is None:
+        return series.rate
+    return 1.0 / np.median(np.diff(series.timestamps[:10000]))
+
+
+def onset_rows(series, onsets, n, chunk_rows=ONSET_CHUNK_ROWS):
+    """Nearest sample row of each onset (-1 if outside the recording). Timestamps are scanned chunk_rows
+    at a time (with the previous chunk's last sample, so onsets between chunks find both neighbours)."""
+    onsets = np.asarray(onsets, dtype=np.float64)
+    if series.timestamps is None:
+        rows = np.round((onsets - (series.starting_time or 0.0)) * series.rate).astype(np.int64)
+        rows[(rows < 0) | (rows >= n)] = -1
+        return rows
+    rows = np.full(len(onsets), -1, dtype=np.int64)
+    order = np.argsort(onsets, kind='stable')
+    sorted_onsets = onsets[order]
+    for start in range(0, n, chunk_rows):
+        base = max(start - 1, 0)
+        times = np.asarray(series.timestamps[base:min(start + chunk_rows, n)], dtype=np.float64)
+        a = np.searchsorted(sorted_onsets, times[0], side='left')
+        b = np.searchsorted(sorted_onsets, times[-1], side='right')
+        if a == b:
+            continue
+        on = sorted_onsets[a:b]
+        if len(times) == 1:
+            rows[order[a:b]] = base
+            continue
+        local = np.clip(np.searchsorted(times, on), 1, len(times) - 1)
+        local -= (on - times[local - 1]) < (times[local] - on)
+        rows[order[a:b]] = base + local
+    return rows
+
+
+def theta_batch(task, band=THETA_BAND, order=4, chunk_s=60.0, pad_s=5.0):
+    """Worker: (phase, amplitude) at the onset rows for the channels c0:c1 of one session.
+    task = (full_path, series_path, rows, c0, c1), rows from onset_rows() (-1: no sample)."""
+    from scipy.signal import butter, sosfiltfilt, hilbert
+    full_path, series_path, rows, c0, c1 = task
+    with h5py.File(full_path, 'r') as f:
+        series = H5TimeSeries(f[series_path])
+        n = series.data.shape[0]
+        fs = sampling_rate(series)
+        conversion = float(series.data.attrs.get('conversion', 1.0))
+        sos = butter(order, band, btype='bandpass', fs=fs, output='sos')
+        by_row = np.argsort(rows, kind='stable')
+        sorted_rows = rows[by_row]
+
+        phase = np.full((len(rows), c1 - c0), np.nan, dtype=np.float32)
+        amplitude = np.full((len(rows), c1 - c0), np.nan, dtype=np.float32)
+        chunk, pad = int(chunk_s * fs), int(pad_s * fs)
+        for start in range(0, n, chunk):
+            stop = min(start + chunk, n)
+            a, b = np.searchsorted(sorted_rows, [start, stop])
+            if a == b:
+                continue
+            lo, hi = max(0, start - pad), min(n, stop + pad)
+            block = series.data[lo:hi, c0:c1] if series.data.ndim == 2 else series.data[lo:hi, None]
+            analytic = hilbert(sosfiltfilt(sos, np.asarray(block, dtype=np.float64), axis=0), axis=0)
+            sel = by_row[a:b]
+            values = analytic[rows[sel] - lo]
+            phase[sel] = np.angle(values)
+            amplitude[sel] = np.abs(values) * conversion
+    return phase, amplitude
+
+
+def locking_summary(phase, amplitude):
+    """(mean resultant length averaged over channels, circular mean phase, mean amplitude) of onset samples."""
+    if len(phase) == 0:
+        return np.nan, np.nan, np.nan
+    vectors = np.nanmean(np.exp(1j * phase.astype(np.float64)), axis=0)
+    return float(np.mean(np.abs(vectors))), float(np.angle(np.mean(vectors))), float(np.nanmean(amplitude))
+
+
+def session_tasks(full_path, series_name, batch, events_path):
+    """Worker: (onsets per phase, channel count, theta_batch tasks) for one session. The onset rows are
+    resolved here, once per session, so the theta_batch workers never read the timestamps."""
+    onsets = session_onsets(full_path, 'Fixation', events_path)
+    all_onsets = np.concatenate([onsets[phase] for phase in PHASES])
+    with h5py.File(full_path, 'r') as f:
+        series_path = find_electrical_series(f, series_name)
+        series = H5TimeSeries(f[series_path])
+        shape = series.data.shape
+        rows = onset_rows(series, all_onsets, shape[0])
+    n_channels = shape[1] if len(shape) == 2 else 1
+    tasks = [(full_path, series_path, rows, c0, min(c0 + batch, n_channels))
+             for c0 in range(0, n_channels, batch)]
+    return onsets, n_channels, tasks
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Theta phase/amplitude of the LFP at fixation onsets.')
+    add_jobs_argument(parser)
+    parser.add_argument('--series', default=None, help='ElectricalSeries name (default: first found)')
+    parser.add_argument('--band', type=float, nargs=2, default=THETA_BAND, metavar=('LOW', 'HIGH'), help='Hz')
+    parser.add_argument('--order', type=int, default=4, help='Butterworth order (applied forward and backward)')
+    parser.add_argument('--chunk', type=float, default=60.0, help='seconds of signal kept per chunk')
+    parser.add_argument('--pad', type=float, default=5.0, help='seconds of padding filtered and discarded per side')
+    parser.add_argument('--batch', type=int, default=8, help='channels per work item')
+    parser.add_argument('--events', default=None, help='event store/.npz/.pkl to take onsets from (default: extract)')
+    args = parser.parse_args()
+
+    sessions = {}
+    tasks = []
+    # Onset extraction and row lookup run per session in the pool too
+    for full_path, prepared, error in run_sessions(session_tasks, find_sessions(data_path), args.jobs,
+                                                   (args.series, args.batch, args.events)):
+        pid, run_key = session_key(full_path)
+        if error is not None:
+            print(f"Skipping {pid} ({run_key}): {error}")
+            continue
+        onsets, n_channels, session_work = prepared
+        sessions[full_path] = {'onsets': onsets, 'n_channels': n_channels, 'results': {}, 'error': None}
+        tasks.extend(session_work)
+
+    print(f"Theta {args.band[0]:g}-{args.band[1]:g} Hz at fixation onsets: {len(sessions)} sessions, "
+          f"{len(tasks)} channel batches\n")
+    for task, result, error in run_sessions(theta_batch, tasks, args.jobs,
+                                            (tuple(args.band), args.order, args.chunk, args.pad)):
+        session = sessions[task[0]]
+        if error is not None:
+            session['error'] = error
+        else:
+            session['results'][task[3]] = result
+
+    out_dir = os.path.join(output_folder, 'theta_fixation')
+    os.makedirs(out_dir, exist_ok=True)
+    summary = []
+    for full_path, session in sessions.items():
+        pid, run_key = session_key(full_path)
+        if session['error'] is not None:
+            print(f"Error in {pid} ({run_key}): {session['error']}")
+            continue
+        starts = sorted(session['results'])
+        phase = np.concatenate([session['results'][c0][0] for c0 in starts], axis=1)
+        amplitude = np.concatenate([session['results'][c0][1] for c0 in starts], axis=1)
+        arrays = {'channels': np.arange(session['n_channels']), 'band': np.asarray(args.band)}
+        line = []
+        first = 0
+        for ph in PHASES:
+            onsets = session['onsets'][ph]
+            rows = slice(first, first + len(onsets))
+            first += len(onsets)
+            arrays[f"{ph}/onsets"] = onsets
+            arrays[f"{ph}/phase"] = phase[rows]
+            arrays[f"{ph}/amplitude"] = amplitude[rows]
+            plv, mean_phase, mean_amp = locking_summary(phase[rows], amplitude[rows])
+            summary.append({'pid': pid, 'run': run_key, 'phase': ph, 'n_onsets': len(onsets),
+                            'n_channels': session['n_channels'], 'plv': plv, 'mean_phase': mean_phase,
+                            'mean_amplitude': mean_amp})
+            line.append(f"{ph} PLV {plv:.3f} at {mean_phase:+.2f} rad")
+        np.savez(os.path.join(out_dir, f"{pid}_{run_key}.npz"), **arrays)
+        print(f"{pid} ({run_key}): {session['n_channels']} channels, " + ', '.join(line))
+
+    summary_path = os.path.join(output_folder, 'theta_fixation_summary.csv')
+    with open(summary_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['pid', 'run', 'phase', 'n_onsets', 'n_channels', 'plv',
+                                               'mean_phase', 'mean_amplitude'], lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(summary)
+    print(f"\nPer-onset arrays saved to: {out_dir}")
+    print(f"Summary saved to: {summary_path}")
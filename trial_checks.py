@@ -0,0 +1,90 @@
+'''
+Trials-table checks for every session (the cohort version of check/check_enco_count.py), used by
+`nwb_eyetracking.py check`. For each file, in time order:
+-> exactly one encoding row, and it is row 0
+-> recognition rows after it, with the encoding stop at or before the first recognition start (gap, no overlap)
+-> stop_time >= start_time for every trial, and recognition trials do not overlap each other
+-> the expected number of recognition trials (expected_reco, if given)
+-> Saccade/Fixation/Blink timestamps never decrease (the extractors binary-search them)
+check_session() returns one dict per file; 'problems' lists what failed (empty = OK), and
+'enco_window'/'reco_window' are the windows get_encoding_recognition_windows() would compute.
+Only the trials table and the event timestamps are read (h5py fast path), so this runs in well under
+a second per file. The windows of the sessions that pass are written to phase_index.py's index.
+'''
+import numpy as np
+from nwb_session import open_nwb, EVENT_INTERFACES
+from sessions import session_key
+
+
+def _phase_names(table):
+    if 'stim_phase' not in table.colnames:
+        return None
+    return [p.decode() if isinstance(p, bytes) else str(p) for p in table['stim_phase'].data[:]]
+
+
+def _decreasing_timestamps(beh):
+    """{interface: number of decreasing steps} for the event series whose timestamps go backwards."""
+    bad = {}
+    for name in EVENT_INTERFACES:
+        if name in beh.data_interfaces:
+            ts = np.asarray(beh[name]['TimeSeries'].timestamps[:], dtype=np.float64)
+            n_back = int(np.count_nonzero(np.diff(ts) < 0))
+            if n_back:
+                bad[name] = n_back
+    return bad
+
+
+def check_session(full_path, expected_reco=None):
+    """{'pid', 'run', 'n_trials', 'n_encoding', 'n_recognition', 'gap', 'enco_window', 'reco_window',
+    'problems'} for one session."""
+    pid, run_key = session_key(full_path)
+    with open_nwb(full_path) as nwb:
+        table = nwb.intervals['trials']
+        starts = np.asarray(table['start_time'].data[:], dtype=np.float64)
+        stops = np.asarray(table['stop_time'].data[:], dtype=np.float64)
+        phases = _phase_names(table)
+        backwards = _decreasing_timestamps(nwb.processing['behavior'])
+    order = np.argsort(starts, kind='stable')
+    starts, stops = starts[order], stops[order]
+
+    problems = [f"{name} timestamps decrease {n}x" for name, n in backwards.items()]
+    if phases is None:
+        # No phase labels: assume the layout (row 0 encoding, rest recognition)
+        is_enc = np.arange(len(starts)) == 0
+        problems.append('no stim_phase column')
+    else:
+        labels = np.asarray([p.lower() for p in phases], dtype=object)[order]
+        is_enc = labels == 'encoding'
+        unknown = sorted(set(labels[~is_enc & (labels != 'recognition')]))
+        if unknown:
+            problems.append(f"unknown stim_phase {unknown}")
+    n_enc = int(is_enc.sum())
+    n_rec = len(starts) - n_enc
+
+    if n_enc != 1:
+        problems.append(f"{n_enc} encoding rows")
+    elif not is_enc[0]:
+        problems.append('encoding is not the first trial')
+    if n_rec == 0:
+        problems.append('no recognition trials')
+    elif expected_reco and n_rec != expected_reco:
+        problems.append(f"{n_rec} recognition trials (expected {expected_reco})")
+    if np.any(stops < starts):
+        problems.append(f"{int(np.sum(stops < starts))} trials end before they start")
+
+    gap = np.nan
+    if len(starts) > 1:
+        gap = float(starts[1] - stops[0])
+        if gap < 0:
+            problems.append(f"encoding overlaps recognition by {-gap:.3f}s")
+        reco_overlaps = int(np.sum(starts[2:] < stops[1:-1]))
+        if reco_overlaps:
+            problems.append(f"{reco_overlaps} overlapping recognition trials")
+
+    # Same windows as eye_events.get_encoding_recognition_windows (row 0 encoding, the rest recognition)
+    enco_window = reco_window = None
+    if len(starts) > 1:
+        enco_window = [float(starts[0]), float(stops[0])]
+        reco_window = [float(starts[1]), float(stops[-1])]
+    return {'pid': pid, 'run': run_key, 'n_trials': len(starts), 'n_encoding': n_enc, 'n_recognition': n_rec,
+            'gap': gap, 'enco_window': enco_window, 'reco_window': reco_window, 'problems': problems}
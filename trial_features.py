@@ -0,0 +1,149 @@
+'''
+Per-trial gaze feature matrix for modelling response_correct: one row per recognition trial of every
+session, built with segmented reductions instead of per-trial masks:
+-> events are mapped to trials in one searchsorted pass (trial_stats.assign_trials, --trial-rule) and
+   sorted by trial once; counts, sums and means come from np.bincount, maxima from np.maximum.reduceat,
+   duration quantiles from one lexsort per session (trial_stats.segment_quantiles) and the pupil slope
+   from bincount least-squares sums (trial_stats.segment_slope)
+-> artifacts are saccades/fixations overlapping a blink (overlap.flag_artifacts, as in capture_all.py)
+Feature columns (see FEATURES): fixation count, dwell, mean/std and quantiles of fixation duration;
+saccade count, duration, amplitude and velocity mean/std/max; pupil mean and slope (fixation pupil
+size per second of trial time); blink count and time; artifact fraction; trial duration.
+Writes pkl/trial_features.parquet (pyarrow) or .csv (--format csv) with the key columns pid, run, trial,
+start_time, the features and the label response_correct (1/0, NaN without a response), e.g.
+    df = pd.read_parquet('pkl/trial_features.parquet').dropna(subset=['response_correct'])
+    X, y = df[FEATURES], df['response_correct'].astype(int)
+'''
+import os
+import argparse
+import numpy as np
+import config
+from overlap import flag_artifacts
+from trial_stats import RULES, assign_trials, trial_segments, segment_reduce, segment_quantiles, segment_slope
+from pipeline import load_session, IGNORE_PATIENTS
+from sessions import find_sessions, session_key, run_sessions, add_jobs_argument, add_prefetch_argument
+
+data_path = config.data_path
+output_folder = config.pkl_folder
+
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+KEY_COLUMNS = ('pid', 'run', 'trial', 'start_time')
+FEATURES = (
+    ('trial_duration', 'n_fixations', 'fix_dwell', 'fix_dur_mean', 'fix_dur_std')
+    + tuple(f"fix_dur_q{int(q * 100)}" for q in QUANTILES)
+    + ('n_saccades', 'sac_dur_mean', 'sac_amp_mean', 'sac_amp_std', 'sac_amp_max',
+       'sac_velo_mean', 'sac_velo_std', 'sac_velo_max',
+       'pupil_mean', 'pupil_slope', 'n_blinks', 'blink_time', 'artifact_fraction')
+)
+LABEL = 'response_correct'
+
+
+def segment_moments(trial_idx, values, n_trials):
+    """(count, mean, std) of the non-NaN values per trial (population std, NaN where empty)."""
+    values = np.asarray(values, dtype=np.float64)
+    keep = (trial_idx >= 0) & ~np.isnan(values)
+    idx, v = trial_idx[keep], values[keep]
+    count = np.bincount(idx, minlength=n_trials)
+    total = np.bincount(idx, v, n_trials)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+        # Second pass around the per-trial mean (no E[x^2] - E[x]^2 cancellation)
+        var = np.bincount(idx, (v - mean[idx]) ** 2, n_trials) / count
+    return count, mean, np.sqrt(np.where(count > 0, var, np.nan))
+
+
+def segment_max(trial_idx, values, n_trials):
+    """Per-trial maximum of the non-NaN values via np.maximum.reduceat on the trial-sorted events."""
+    values = np.asarray(values, dtype=np.float64)
+    trial_idx = np.where(np.isnan(values), -1, trial_idx)
+    order, counts, offsets = trial_segments(trial_idx, n_trials)
+    return segment_reduce(np.maximum, values[order], counts, offsets)
+
+
+def trial_features(session, rule='start', quantiles=QUANTILES):
+    """Feature columns (dict of arrays, one row per recognition trial in time order) for one loaded
+    session (pipeline.load_session); row 0 of the time-sorted trials is encoding and is left out."""
+    trials = {col: arr[1:] for col, arr in session['trials'].items()}
+    t0, t1 = trials['start_time'], trials['stop_time']
+    n = len(t0)
+    saccades, fixations, blinks = dict(session['saccades']), dict(session['fixations']), session['blinks']
+    flag_artifacts(saccades, blinks)
+    flag_artifacts(fixations, blinks)
+
+    fix_idx = assign_trials(fixations['start'], fixations['end'], t0, t1, rule)
+    sac_idx = assign_trials(saccades['start'], saccades['end'], t0, t1, rule)
+    blink_idx = assign_trials(blinks['start'], blinks['end'], t0, t1, rule)
+
+    table = {'trial': np.arange(n), 'start_time': t0, 'trial_duration': t1 - t0}
+    fix_dur = fixations['duration']
+    table['n_fixations'] = np.bincount(fix_idx[fix_idx >= 0], minlength=n)
+    table['fix_dwell'] = np.bincount(fix_idx[fix_idx >= 0], np.nan_to_num(fix_dur[fix_idx >= 0]), n)
+    _, table['fix_dur_mean'], table['fix_dur_std'] = segment_moments(fix_idx, fix_dur, n)
+    for q, values in zip(quantiles, segment_quantiles(fix_idx, fix_dur, n, quantiles)):
+        table[f"fix_dur_q{int(q * 100)}"] = values
+
+    table['n_saccades'] = np.bincount(sac_idx[sac_idx >= 0], minlength=n)
+    table['sac_dur_mean'] = segment_moments(sac_idx, saccades['duration'], n)[1]
+    for col, name in (('amplitude', 'sac_amp'), ('velocity', 'sac_velo')):
+        _, table[f"{name}_mean"], table[f"{name}_std"] = segment_moments(sac_idx, saccades[col], n)
+        table[f"{name}_max"] = segment_max(sac_idx, saccades[col], n)
+
+    table['pupil_mean'] = segment_moments(fix_idx, fixations['pupil_size'], n)[1]
+    rel_start = fixations['start'] - t0[np.maximum(fix_idx, 0)]
+    table['pupil_slope'] = segment_slope(fix_idx, rel_start, fixations['pupil_size'], n)
+
+    table['n_blinks'] = np.bincount(blink_idx[blink_idx >= 0], minlength=n)
+    table['blink_time'] = np.bincount(blink_idx[blink_idx >= 0], np.nan_to_num(blinks['duration'][blink_idx >= 0]), n)
+
+    n_events = table['n_fixations'] + table['n_saccades']
+    n_artifacts = (np.bincount(fix_idx[fix_idx >= 0], fixations['is_artifact'][fix_idx >= 0], n)
+                   + np.bincount(sac_idx[sac_idx >= 0], saccades['is_artifact'][sac_idx >= 0], n))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        table['artifact_fraction'] = np.where(n_events > 0, n_artifacts / n_events, np.nan)
+    table[LABEL] = trials['response_correct']
+    return table
+
+
+def feature_frame(tables):
+    """One DataFrame from (pid, run, table) triples, columns KEY_COLUMNS + FEATURES + LABEL."""
+    import pandas as pd
+    frames = [pd.DataFrame(dict(table, pid=pid, run=run)) for pid, run, table in tables]
+    columns = list(KEY_COLUMNS) + list(FEATURES) + [LABEL]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(frames, ignore_index=True)[columns]
+    for col in ('pid', 'run'):
+        df[col] = df[col].astype('category')
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-trial gaze feature matrix for the recognition trials.')
+    add_jobs_argument(parser)
+    add_prefetch_argument(parser)
+    parser.add_argument('--trial-rule', choices=RULES, default='start',
+                        help="events per trial: 'start' inside the trial or fully 'inside' it")
+    parser.add_argument('--format', choices=('parquet', 'csv'), default='parquet', help='output file format')
+    args = parser.parse_args()
+
+    paths = [p for p in find_sessions(data_path) if session_key(p)[0] not in IGNORE_PATIENTS]
+    print(f"Building trial features for {len(paths)} sessions...\n")
+    tables = []
+    for full_path, table, error in run_sessions(trial_features, paths, args.jobs, (args.trial_rule,),
+                                                load_session, args.prefetch):
+        pid, run_key = session_key(full_path)
+        if error is not None:
+            print(f"Error in {pid} ({run_key}): {error}")
+            continue
+        tables.append((pid, run_key, table))
+        print(f"{pid} ({run_key}): {len(table['trial'])} recognition trials")
+
+    df = feature_frame(tables)
+    os.makedirs(output_folder, exist_ok=True)
+    out_path = os.path.join(output_folder, f"trial_features.{args.format}")
+    if args.format == 'parquet':
+        df.to_parquet(out_path, index=False)
+    else:
+        df.to_csv(out_path, index=False, lineterminator='\n')
+    labelled = int(df[LABEL].notna().sum())
+    print(f"\n{len(df)} trials x {len(FEATURES)} features ({labelled} with a response) saved to: {out_path}")
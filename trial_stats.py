@@ -0,0 +1,128 @@
+'''
+Vectorized per-trial aggregation of gaze events (replaces per-trial boolean masks over all events).
+assign_trials() maps every event to its trial in one np.searchsorted pass over the sorted trial starts;
+trial_summary() then reduces event columns per trial with np.bincount and joins response_correct.
+trial_segments() sorts the assigned events by trial once; segment_reduce(), segment_quantiles() and
+segment_slope() reduce contiguous per-trial runs (ufunc.reduceat / bincount) for the feature matrix.
+Inclusion rules (trial windows are inclusive at both ends, as in plots2.py):
+-> 'start'  : event start inside the trial (the original plots2.py mask)
+-> 'inside' : event fully inside the trial (the rule used for the Encoding/Recognition split)
+Trials are assumed not to overlap; an event starting exactly on a shared boundary goes to the later trial.
+'''
+import numpy as np
+
+RULES = ('start', 'inside')
+
+
+def assign_trials(start, end, trial_start, trial_stop, rule='start'):
+    """Trial index (into the given trial arrays) for each event, -1 if it is in no trial."""
+    if rule not in RULES:
+        raise ValueError(f"rule must be one of {RULES}, got {rule!r}")
+    start = np.asarray(start, dtype=np.float64)
+    trial_start = np.asarray(trial_start, dtype=np.float64)
+    trial_stop = np.asarray(trial_stop, dtype=np.float64)
+    if len(trial_start) == 0:
+        return np.full(len(start), -1, dtype=np.int64)
+    order = np.argsort(trial_start, kind='stable')
+    s_sorted, e_sorted = trial_start[order], trial_stop[order]
+
+    k = np.searchsorted(s_sorted, start, side='right') - 1
+    found = k >= 0
+    k_safe = np.where(found, k, 0)
+    if rule == 'start':
+        found &= start <= e_sorted[k_safe]
+    else:
+        found &= np.asarray(end, dtype=np.float64) <= e_sorted[k_safe]
+    return np.where(found, order[k_safe], -1)
+
+
+def trial_counts_means(trial_idx, values, n_trials):
+    """(count, mean) of values per trial (NaN mean where a trial has no events)."""
+    keep = trial_idx >= 0
+    idx = trial_idx[keep]
+    count = np.bincount(idx, minlength=n_trials)
+    total = np.bincount(idx, weights=np.asarray(values, dtype=np.float64)[keep], minlength=n_trials)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+    return count, mean
+
+
+def trial_segments(trial_idx, n_trials):
+    """(order, counts, offsets): indices of the assigned events sorted by trial (stable, so each trial's
+    events keep their order), events per trial and the first position of each trial in order."""
+    trial_idx = np.asarray(trial_idx)
+    assigned = np.flatnonzero(trial_idx >= 0)
+    order = assigned[np.argsort(trial_idx[assigned], kind='stable')]
+    counts = np.bincount(trial_idx[assigned], minlength=n_trials)
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    return order, counts, offsets
+
+
+def segment_reduce(ufunc, sorted_values, counts, offsets, empty=np.nan):
+    """ufunc.reduceat over each trial's run of sorted_values (e.g. np.maximum); empty for trials without
+    events (reduceat would return the next element for an empty segment)."""
+    out = np.full(len(counts), empty, dtype=np.float64)
+    nonempty = counts > 0
+    if nonempty.any():
+        out[nonempty] = ufunc.reduceat(np.asarray(sorted_values, dtype=np.float64), offsets[nonempty])
+    return out
+
+
+def segment_quantiles(trial_idx, values, n_trials, qs):
+    """(len(qs), n_trials) quantiles of values per trial, NaNs ignored (np.quantile's linear method).
+    One lexsort orders values inside every trial, then each quantile is an interpolation between two
+    positions of each trial's run."""
+    values = np.asarray(values, dtype=np.float64)
+    trial_idx = np.where(np.isnan(values), -1, np.asarray(trial_idx))
+    keep = np.flatnonzero(trial_idx >= 0)
+    order = keep[np.lexsort((values[keep], trial_idx[keep]))]
+    sorted_values = values[order]
+    counts = np.bincount(trial_idx[keep], minlength=n_trials)
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+
+    out = np.full((len(qs), n_trials), np.nan)
+    has = counts > 0
+    for i, q in enumerate(qs):
+        pos = q * (counts[has] - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, counts[has] - 1)
+        a, b = sorted_values[offsets[has] + lo], sorted_values[offsets[has] + hi]
+        out[i, has] = a + (b - a) * (pos - lo)
+    return out
+
+
+def segment_slope(trial_idx, x, y, n_trials):
+    """Least-squares slope of y over x per trial from bincount sums (NaN with < 2 points or constant x).
+    Pass x relative to the trial start to keep the sums well conditioned."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = (np.asarray(trial_idx) >= 0) & ~(np.isnan(x) | np.isnan(y))
+    idx, x, y = np.asarray(trial_idx)[keep], x[keep], y[keep]
+    n = np.bincount(idx, minlength=n_trials).astype(np.float64)
+    sx, sy = np.bincount(idx, x, n_trials), np.bincount(idx, y, n_trials)
+    sxx, sxy = np.bincount(idx, x * x, n_trials), np.bincount(idx, x * y, n_trials)
+    denom = n * sxx - sx * sx
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where((n >= 2) & (denom > 1e-12 * n * sxx), (n * sxy - sx * sy) / denom, np.nan)
+
+
+def trial_summary(trial_start, trial_stop, fixations=None, saccades=None, response_correct=None, rule='start'):
+    """Per-trial table (dict of arrays, one row per trial in the given order): fixation count,
+    mean duration and pupil; saccade count, mean duration, amplitude and velocity; response_correct."""
+    trial_start = np.asarray(trial_start, dtype=np.float64)
+    trial_stop = np.asarray(trial_stop, dtype=np.float64)
+    n = len(trial_start)
+    table = {'trial': np.arange(n), 'start_time': trial_start, 'stop_time': trial_stop}
+    if response_correct is not None:
+        table['response_correct'] = np.asarray(response_correct, dtype=np.float64)
+
+    if fixations is not None:
+        idx = assign_trials(fixations['start'], fixations['end'], trial_start, trial_stop, rule)
+        table['n_fixations'], table['fix_dur_mean'] = trial_counts_means(idx, fixations['duration'], n)
+        table['pupil_mean'] = trial_counts_means(idx, fixations['pupil_size'], n)[1]
+    if saccades is not None:
+        idx = assign_trials(saccades['start'], saccades['end'], trial_start, trial_stop, rule)
+        table['n_saccades'], table['sac_dur_mean'] = trial_counts_means(idx, saccades['duration'], n)
+        table['sac_amp_mean'] = trial_counts_means(idx, saccades['amplitude'], n)[1]
+        table['sac_velo_mean'] = trial_counts_means(idx, saccades['velocity'], n)[1]
+    return table